@@ -64,1021 +64,4269 @@ import argparse
 
 import codecs
 
+import collections
+
+import concurrent.futures
+
 import configparser
 
+import contextlib
+
+import copy
+
+import csv
+
 import datetime
 
+import decimal
+
 import DWHTestDocGenerator
 
 import filecmp
 
+import hashlib
+
+import heapq
+
+import itertools
+
+import io
+
+import json
+
+import multiprocessing.connection
+
 import os
 
 import pathlib
 
+import queue
+
 import re
 
 import shutil
 
-import teradata_funcs
-
- 
+import sqlite3
 
-class DWHTestInit:
+import subprocess
 
-    '''Initialize testing for an EDW JIRA development or PRD'''
+import sys
 
-    def __init__(self):
+import tempfile
 
-        '''(1) Checkout code
+import teradata_funcs
 
-           (2) Validate/create deploy_items.txt
+import threading
 
-           (3) Do more things'''
+import time
 
-        #hardcoded values
+import traceback
 
-        self.g_drive='\\\\ilife400\home'
+try: #optional, only needed for --parquet
 
-        self.test_doc_templates_dir = pathlib.Path(f'{self.g_drive}\Projects\_templates')
+    import pyarrow
 
-        assert(self.test_doc_templates_dir.is_dir())
+    import pyarrow.parquet
 
-        self.default_inifilename, self.general_config_name = 'EDWTAU.ini', 'EDWTAU'
+except ImportError:
 
-       
+    pyarrow = None
 
-        inifilename, configname, self.post_load_test = self.get_args()
+try: #optional, --watch polls the TERADATA folder without it
 
-        if inifilename == None: inifilename = self.default_inifilename
+    import watchdog.events
 
-        self.ini = self.read_ini(inifilename, configname)
+    import watchdog.observers
 
-        self.current_dir = pathlib.Path.cwd()
+except ImportError:
 
-        self.session = teradata_funcs.teradata_funcs('DWHDR')
+    watchdog = None
 
  
 
-        svnkeys, multi_svn_id = [], '' #multiple SVN locations
+RENAME_VIEW_TO = re.compile('(?<=TO).*(?=;)', re.IGNORECASE)
 
-        for key in self.ini:
+#statement patterns for parse_dependencies(), matched against upper case statements with comments removed and whitespace collapsed
 
-            if key.startswith('svn'): svnkeys.append(key)
+VIEW_DDL = re.compile(r'^(?:REPLACE|CREATE) (?:RECURSIVE )?VIEW ([^ (]+) ?(?:\([^)]*\) )?AS (.*)$')
 
-        for svnkey in svnkeys:
+TABLE_DDL = re.compile(r'^CREATE (?:(?:MULTISET|SET) )?(?:(?:GLOBAL TEMPORARY|VOLATILE) )?TABLE ([^ (,]+)')
 
-            multi_svn_id = f'_{pathlib.Path(self.ini[svnkey]).name}'
+RENAME_VIEW_DDL = re.compile(r'^RENAME VIEW ([^ ]+) (?:TO|AS) ([^ ]+)$')
 
-            if self.ini[svnkey].startswith('https'):
+OBJECT_REFERENCE = re.compile(r'\b(?:FROM|JOIN) \(?([\w$#"]+\.[\w$#"]+)')
 
-                if not self.post_load_test:
+TRIVIAL_VIEW = re.compile(r'^(?:LOCK(?:ING)? (?:ROW|TABLE [^ ]+|[^ ]+) FOR ACCESS )?SEL(?:ECT)? (?:\w+\.)?\* FROM ([\w$#"]+\.[\w$#"]+)(?: (?:AS )?\w+)?$')
 
-                    self.checkout(self.ini[svnkey], self.ini['work_folder'])
+ 
 
-               
+def parse_AELO_file(filename):
 
-                # get paths, file lists etc from checked out application code
+    '''return [(object, database), ...] for each database.[table|view] created in a DDL/SQL file, in file order
 
-                checkout_target_dir = self.ini['work_folder'] + '\\' + self.ini[svnkey].split('/')[-1:][0]
+    databases are returned as written, e.g. DW$$ENV$$V_ODS'''
 
-                self.dir_list, self.file_list = self.svn_directory_and_file_lists(checkout_target_dir)
+    summary_text = ['CREATE TABLE','CREATE MULTISET TABLE','CREATE SET TABLE','REPLACE VIEW','RENAME VIEW']
 
-                self.teradata_path, self.teradata_parent_path = self.get_teradata_paths(self.dir_list)
+    AELO_list = []
 
-                #print(f'{self.teradata_path}\n{self.teradata_parent_path}')
+    filename = pathlib.Path(filename)
 
-                if self.teradata_path is not None and self.teradata_parent_path is not None:
+    if filename.name == 'deploy_items.tmp': return AELO_list #might be unlinked (deleted)
 
-                    self.deploy_items_path, self.synopsis_list = self.validate_create_deploy_items(multi_svn_id)
+    if filename.suffix.lower() not in ['.ddl','.sql']: return AELO_list
 
-                    if self.synopsis_list is not None:
+    if filename.stat().st_size == 0: return AELO_list #firstlines.append('(empty file)')
 
-                        if not self.post_load_test:
+    #file = open(filename, "r", encoding="utf-8")
 
-                            synopsis_file = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_synopsis{multi_svn_id}.txt")
+    with open(filename, "r") as file:
 
-                            self.synopsize(self.synopsis_list, synopsis_file, multi_svn_id)
+        for line in file:
 
-                            self.check_databases_exist()
+            append_line = line.upper().strip()
 
-                            #self.remove_BOM()
+            if append_line.startswith('--'): continue
 
-                            #self.semicolon()
+            for summary in summary_text:
 
-                            self.DDL_replace_text()
+                if append_line.find(summary) != -1:
 
-                            self.init_deploy(multi_svn_id)
+                    append_line = append_line.lstrip(summary)
 
-                        else:
+                    if summary == 'RENAME VIEW':
 
-                            # this only runs if -z switch used
+                        m = RENAME_VIEW_TO.search(append_line)
 
-                            query_row_counts_filename = pathlib.Path(self.ini['work_folder']) / 'Test Scripts' / pathlib.Path(f"{self.ini['dwh']}_row_counts{multi_svn_id}.sql")
+                        #m = re.compile('(?<=TO).*(?=[ ;])', re.IGNORECASE).search(append_line)
 
-                            self.create_query_row_counts(self.synopsis_list, query_row_counts_filename)
+                        if m is not None:
 
-                            query_data_checks_filename = pathlib.Path(self.ini['work_folder']) / 'Test Scripts' / pathlib.Path(f"{self.ini['dwh']}_data_checks{multi_svn_id}.sql")
+                            append_line = m.group().strip().rstrip(';').rstrip()
 
-                            self.create_query_data_checks(self.synopsis_list, query_data_checks_filename)
+                        else:
 
-            else:
+                            print(f'There is some kind of issue (A) parsing this line that should be investigated: {append_line}')
 
-                if self.ini[svnkey] == '': print('No SVN location has been specifed')
+                    else:
 
-                else:
+                        #append_line = append_line.lstrip().split(' ')[0].replace('"','').replace(',','').replace('NO FALLBACK','').replace('FALLBACK','')
 
-                    print(f"SVN: '{self.ini[svnkey]}'")
+                        append_line = append_line.lstrip().replace('"','').replace(',','').replace('NO FALLBACK','').replace('FALLBACK','').rstrip()
 
-                    for i in range(2, 20):
+                        if ' AS ' in append_line.upper():
 
-                        if svnkey+1 in self.ini: print(f"SVN{i}: '{self.ini[svnkey+1]}'")
+                            as_index = append_line.upper().index(" AS ")
 
-                        else: break
+                            append_line = f'{append_line[:as_index].strip()}'
 
-        self.copy_test_doc_templates(self.ini['work_folder'])
+                        if append_line.endswith('_N') or append_line.endswith('_O'): continue
 
-        self.prd_folder_cmd()
+                    if '.' in append_line:
 
-        print('\nScript complete.')
+                        AELO_list.append((append_line.split('.')[1], append_line.split('.')[0]))
 
- 
+                        break
 
-   def check_databases_exist(self):
+                    else:
 
-        '''check that databases exist'''
+                        print(f'ERROR: Cannot read database.object in {filename.name} from string: {append_line}')
 
-        AELO_dict = self.get_AELO_dict(self.file_list)
+                        break
 
-        dbs, dbs_not_found = [], []
+    return AELO_list
 
-        for table, database_list in AELO_dict.items():
+ 
 
-            for db in database_list:
+def referenced_objects(filename):
 
-                if db not in dbs: dbs.append(db)
+    '''return the set of upper case "database.object" names mentioned in a DDL/SQL file, comments excluded'''
 
-        for db in sorted(dbs):
+    with open(filename, "r") as file:
 
-            query = f"SELECT DatabaseName FROM DBC.Databases WHERE DatabaseName = '{db}';"
+        text = file.read().upper()
 
-            results = self.session.Teradata_query(query)
+    text = re.sub(r'/\*.*?\*/', ' ', text, flags=re.S)
 
-            if results is not None:
+    text = re.sub(r'--[^\n]*', ' ', text)
 
-                if len(results) == 0: #0 rows returned, db not found
+    return set(re.findall(r'[\w$#]+\.[\w$#]+', text.replace('"', '')))
 
-                    print(f'WARNING: db does not exist: {db}')
+ 
 
-                    dbs_not_found.append(db)
+def parse_dependencies(filename):
 
-                elif len(results) == 1: #db found
+    '''return [(object, type, [referenced objects], trivial), ...] for each table/view created in a DDL/SQL file
 
-                    db_found = results[0][0].strip().upper()
+    type is "table" or "view"; a trivial view is a plain SELECT * over a single table/view (its only reference)
 
-                    assert db_found in dbs
+    object names are upper case and returned as written, e.g. DW$$ENV$$V_ODS.ACCOUNT'''
 
-                elif len(results) > 1: #more than 1 db found? impossible
+    filename = pathlib.Path(filename)
 
-                    print(f'These results are most unusual:\n{results}');exit()
+    if filename.suffix.lower() not in ['.ddl','.sql']: return []
 
-            else:
+    dependencies = []
 
-                print(f'CRITICAL: db does not exist: {db}');
+    for statement in ddl_statements(filename):
 
-        if len(dbs_not_found) == 0: print('All dbs exist.')
+        m = VIEW_DDL.match(statement)
 
- 
+        if m:
 
-    def prd_folder_cmd(self):
+            body = m.group(2).strip()
 
-        '''create a .cmd file that opens the prd_folder'''
+            refs = list(dict.fromkeys(OBJECT_REFERENCE.findall(body)))
 
-        if 'prd_folder' not in self.ini: return
+            dependencies.append((m.group(1), 'view', refs, TRIVIAL_VIEW.match(body) is not None))
 
-        prd_folder_cmd_filename = pathlib.Path(self.ini['work_folder']) / pathlib.Path('prd_folder.cmd')
+            continue
 
-        if prd_folder_cmd_filename.exists(): return
+        m = TABLE_DDL.match(statement)
 
-        file = open(prd_folder_cmd_filename, "w")
+        if m:
 
-        file.write(f'explorer "{self.ini["prd_folder"]}\c. Systems Testing"')
+            dependencies.append((m.group(1), 'table', [], False))
 
-        file.close()
+            continue
 
- 
+        m = RENAME_VIEW_DDL.match(statement)
 
-    def copy_test_doc_templates(self, checkout_target_dir):
+        if m: dependencies.append((m.group(2), 'view', [m.group(1)], True))
 
-        '''copy test doc templates to target folder only if the folder does not exist already
+    return dependencies
 
-           filenames in the template directoy must have a "template_" prefix to be recognized'''
+ 
 
-        def template_rename(d, filename_root):
+def ddl_statements(filename):
 
-            '''return 2 paths: (1) template file name (2) DWH-NNNNN file name'''
+    '''return the statements in a DDL/SQL file: upper case, comments and double quotes removed and whitespace collapsed'''
 
-            template_name = pathlib.Path(d) / f'template_{filename_root}'
+    with open(filename, "r") as file:
 
-            DWH_name = pathlib.Path(d) / f'{self.ini["dwh"]}_{filename_root}'
+        text = file.read().upper()
 
-            if template_name.is_file() and not DWH_name.exists():
+    text = re.sub(r'/\*.*?\*/', ' ', text, flags=re.S)
 
-                print(f'Renaming {template_name} to {DWH_name}')
+    text = re.sub(r'--[^\n]*', ' ', text)
 
-                template_name.rename(DWH_name)
+    return [' '.join(statement.replace('"', '').split()) for statement in text.split(';')]
 
-                with open(DWH_name) as f:
+ 
 
-                    s = f.read()
+def explain_estimates(explain_text):
 
-                with open(DWH_name, 'w') as f:
+    '''return (estimated seconds, estimated rows) from the text of a Teradata EXPLAIN
 
-                    s = s.replace('DWH-NNNNN', self.ini["dwh"]).replace('$$ENV$$', self.ini['environment'])
+    seconds is the total estimated time (the sum of the step times if the plan has no total), rows is the largest number
 
-                    f.write(s)
+    of rows a step is estimated to produce; None if the text has no estimate, or a time in a format not understood'''
 
-            #check if .docx files exist in their respective folders
+    def seconds(text):
 
-            for dt in ['Test Approach', 'Test Plan', 'Test Report']:
+        '''seconds in e.g. "1 hour and 5 minutes", "0.12 seconds" or "00:01:05.52", None if not understood'''
 
-                if dt == d.name and dt.replace(' ','_') in DWH_name.name and not DWH_name.is_file():
+        m = re.fullmatch(r'(\d+):(\d\d):(\d\d(?:\.\d+)?)', text.strip())
 
-                    for target_dir in fullpath_test_doc_dirs:
+        if m: return int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
 
-                        if dt in str(target_dir):
+        units = {'hour': 3600, 'minute': 60, 'second': 1}
 
-                            target_file = target_dir / DWH_name.name
+        times = re.findall(r'([\d,]+(?:\.\d+)?) (hour|minute|second)s?', text)
 
-                            if target_file.is_file():
+        return sum(float(n.replace(',', '')) * units[unit] for n, unit in times) if times else None
 
-                                print(f'{target_file} already exists and will not be overwritten.')
+    explain_text = ' '.join(explain_text.split())
 
-                            if not target_file.is_file():
+    total = re.search(r'total estimated time is (.*?)\.(?= |$)', explain_text, re.IGNORECASE)
 
-                                print(f'{target_file} does not exist. Creating...')
+    steps = [seconds(step) for step in re.findall(r'estimated time for this step is (.*?)\.(?= |$)', explain_text, re.IGNORECASE)]
 
-                                doctypes.append(dt)
+    estimated_seconds = seconds(total.group(1)) if total else sum(steps) if steps and None not in steps else None
 
-                            break
+    rows = [int(n.replace(',', '')) for n in re.findall(r'to be ([\d,]+) rows?\b', explain_text)]
 
-       
+    return estimated_seconds, max(rows) if rows else None
 
-        test_doc_dirs = ['Test Approach', 'Test Evidence', 'Test Plan', 'Test Report', 'Test Scripts']
+ 
 
-        test_documents = ['Test_Approach.docx','Test_Plan.docx','Test_Report.docx']
+def object_definitions(filename):
 
-        test_scripts_files = ['01_SELECT.template.sql','02_DELETE.sql','03_SELECT_NON_KEY_VALUES.template.sql','04_UPDATE_NON_KEY_VALUES.sql', \
+    '''return [(object, statement), ...] for each table/view created, replaced or renamed in a DDL/SQL file, in file order
 
-                            '05_SELECT_KEY_VALUES.template.sql','06_UPDATE_KEY_VALUES.sql','07_SELECT_DELETED_KEY_VALUES.template.sql', \
+    statement is the kind of DDL statement, e.g. CREATE MULTISET TABLE, REPLACE VIEW or RENAME VIEW; object names as in parse_dependencies()'''
 
-                            'associated_objects.sql','duplicates.template.sql','ExtractionType_Initial.sql','ExtractionType_Regular.sql','JIRATestScript.csv']
+    filename = pathlib.Path(filename)
 
-        fullpath_test_doc_dirs = [pathlib.Path(checkout_target_dir) / x for x in test_doc_dirs]
+    if filename.suffix.lower() not in ['.ddl','.sql']: return []
 
-        fullpath_test_doc_templates = [pathlib.Path(self.test_doc_templates_dir) / x for x in test_doc_dirs]
+    definitions = []
 
-        doctypes = [] #should contain 0 or more of 'Test Approach', 'Test Plan', 'Test Report'
+    for statement in ddl_statements(filename):
 
-        for d, template in zip(fullpath_test_doc_dirs, fullpath_test_doc_templates):
+        m = VIEW_DDL.match(statement) or TABLE_DDL.match(statement)
 
-            if not d.is_dir(): shutil.copytree(template, d) #only create directory (and copy files) if the directory doesn't exist
+        if m: definitions.append((m.group(1), statement[:m.start(1)].strip()))
 
-            #filename_root values should exist as "template_[filename_root]" in the self.test_doc_templates_dir directory
+        m = RENAME_VIEW_DDL.match(statement)
 
-            for filename_root in test_documents+test_scripts_files:
+        if m: definitions.append((m.group(2), 'RENAME VIEW'))
 
-                #print(f'renaming template_{filename_root} to {filename_root}')
+    return definitions
 
-                #template_rename(template, filename_root)
+ 
 
-                template_rename(d, filename_root)
+def synopsis_line(filename):
 
-        if doctypes: DWHTestDocGenerator.DWHTestDocGenerator(doctypes, self.ini)
+    '''return (kind, line, number of statements) summarizing a ddl/sql file for the synopsis
 
- 
+    kind is "empty", None (nothing to summarize), "truncate" (line is cut to the synopsis width) or "full"'''
 
-    def init_deploy(self, multi_svn_id):
+    summary_text = ['COLLECT STATISTICS','COLLECT STATS','ALTER TABLE','CREATE TABLE','CREATE MULTISET TABLE','CREATE SET TABLE','RENAME TABLE','REPLACE VIEW','CREATE VIEW','REPLACE RECURSIVE VIEW','RENAME VIEW','EXEC','INSERT INTO','DROP TABLE','DROP VIEW','DELETE','UPDATE','SELECT']
 
-        '''get ready to (but don't actually) deploy the application'''
+    filename = pathlib.Path(filename)
 
-        def write_install_ini(deploy_directory):
+    if filename.stat().st_size == 0: return 'empty', '', 0
 
-            filename = deploy_directory / "install.ini"
+   
 
-            try:
+    #count no. of statements (= no. of semicolons)
 
-                file = open(filename, "w")
+    num_semicolons = 0
 
-                file.seek(0)
+    with open(filename, "r") as file:
 
-                file.truncate()
+        for line in file:
 
-                lines_of_text = ["[CONFIG]\n", "SOURCE_DIR=.\n", f"dataSourceName={self.session.DSN}\n",
+            if line.strip().startswith('--'): continue
 
-                    f"TARGET_ENV={self.ini['environment']}\n", "TARGET_ENVS=T02\n", "TARGET_ENVP=B00\n",
+            if line.strip().startswith('/*'): continue
 
-                    "BTEQ=True\n", "FIX_DOLLAR=True\n", "logLevel=INFO\n", "logConsole=True\n", "logDir=.\Log\n"]
+            num_semicolons += line.count(';')
 
-                file.writelines(lines_of_text)
+   
 
-                file.close()
+    with open(filename, "r") as file:
 
-            except:
+        block_comment_mode = False
 
-                raise NameError(f"unable to create {filename}")
+        for line in file:
 
- 
+            while '  ' in line:
 
-        deploy_directory = pathlib.Path(self.ini['work_folder']) / pathlib.Path("deploy")
+                line = line.replace('  ',' ')
 
-        pathlib.Path(deploy_directory).mkdir(parents=True, exist_ok=True) # make target directory
+            append_line = line.strip()
 
-        write_install_ini(deploy_directory)
+            if append_line.startswith('--'): continue
 
-        td_install_path = self.current_dir / 'td_install.py'
+            if append_line.startswith('/*'): block_comment_mode = True
 
-        shutil.copy(td_install_path, deploy_directory)
+            if block_comment_mode:
 
-        td_install_command = f'python td_install.py --appName={self.ini["dwh"]} --SOURCE_DIR="{self.teradata_path}" --OBJECT_LIST="{self.deploy_items_path}"'
+                if '*/' in line:
 
-        td_install_command = td_install_command.replace(self.g_drive, 'G:')
+                    line = f'{line[line.index("*/")+2:].strip()}'
 
-        deploy_cmd_filename = deploy_directory / pathlib.Path(f"{self.ini['dwh']}_deploy{multi_svn_id}.cmd")
+                    block_comment_mode = False
 
-       
+                else:
 
-        GCFR_Log_directory = deploy_directory / 'Log'
+                    continue
 
-        Deployment_directory = pathlib.Path(self.ini['work_folder']) / 'Test Evidence' / 'Deployment'
+            for summary in summary_text:
 
-        copy_log_command = f'IF %ERRORLEVEL% EQU 0 copy "{GCFR_Log_directory}\\{self.ini["dwh"]}*.log" "{Deployment_directory}"'
+                if line.upper().find(summary) != -1:
 
-        copy_log_command = copy_log_command.replace(self.g_drive, 'G:')
+                    if summary in ['COLLECT STATISTICS','COLLECT STATS','EXEC','INSERT INTO','DELETE','UPDATE','SELECT']:
 
-        deploy_cmd_filename.write_text(td_install_command + '\n' + copy_log_command)
+                        return 'truncate', line, num_semicolons
 
-        print(f'Deploy using: {deploy_cmd_filename}')
+                    return 'full', append_line, num_semicolons
 
-       
+    return None, '', num_semicolons
 
-    def DDL_replace_text(self):
+ 
 
-        '''replace production references with test references'''
+def is_teradata_folder(path):
 
-        def find_replace(findtxt, replacetxt, changelist):
+    '''True for the folder deploy_items.txt lists: it ends with "teradata", is not in a Rollback folder and is not ODS_VTERADATA'''
 
-            def replace_text(filename, old_text, new_text):
+    path = str(path).lower()
 
-                with open(filename) as f:
+    return path.endswith('teradata') and 'rollback' not in path and not path.endswith('ods_vteradata')
 
-                    s = f.read()
+ 
 
-                    if old_text not in s:
+def close_session(session):
 
-                        print('"{old_text}" not found in {filename} ... WARNING'.format(**locals()))
+    '''log off a database session opened for a while, if teradata_funcs can'''
 
-                        return
+    close = getattr(session, 'close', None)
 
-                with open(filename, 'w') as f:
+    if callable(close): close()
 
-                    print("Replace\t\"{old_text}\" with \"{new_text}\" in {filename} ... ".format(**locals()), end='')
+ 
 
-                    s = s.replace(old_text, new_text)
+def svn(command, cwd):
 
-                    f.write(s)
+    '''run an svn command in a folder and return its exit status; the working directory of the process is not changed,
 
-                    print("OK")
+    so other steps (e.g. test_docs) can run at the same time'''
 
-                   
+    return subprocess.run(f'svn {command}', shell=True, cwd=cwd).returncode
 
-            askreplace = False
+ 
 
-            for f in self.file_list:
+def sql_literal(value):
 
-                if str(f).lower().endswith('.sql') or str(f).lower().endswith('.ddl'):
+    '''return a value read from Teradata as an SQL literal of its own type, e.g. for an IN list'''
 
-                    file = open(f, "r")
+    if isinstance(value, str): return "'" + value.replace("'", "''") + "'"
 
-                    filedata = file.read()
+    if isinstance(value, datetime.datetime): return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
 
-                    if findtxt in filedata:
+    if isinstance(value, datetime.date): return f"DATE '{value.isoformat()}'"
 
-                        print(f)
+    if isinstance(value, datetime.time): return f"TIME '{value.isoformat()}'"
 
-                        askreplace = True
+    if isinstance(value, decimal.Decimal): return format(value, 'f')
 
-                        file.close()
+    if isinstance(value, float): return repr(value)
 
-                        break
+    if isinstance(value, bytes): return f"'{value.hex()}'XB"
 
-            if askreplace and self.ask_YNQ(f"Replace {findtxt} with {replacetxt}", "n"):
+    return str(value)
 
-                for f in self.file_list:
+ 
 
-                    if str(f).lower().endswith('.sql') or str(f).lower().endswith('.ddl'):
+def key_value(value):
 
-                        file = open(f, "r")
+    '''return a key value read from Teradata as the data checks compare it: CHAR padding removed'''
 
-                        filedata = file.read()
+    return value.rstrip(' ') if isinstance(value, str) else value
 
-                        if findtxt in filedata:
+ 
 
-                            print()
+class KeyValues:
 
-                            replace_text(f, findtxt, replacetxt)
+    '''key values read by one query, to recognise them in the rows of another query in their own type (see data_check_evidence)
 
-                            if not f in changelist: changelist[f] = 1
+    CHAR padding is ignored and, if there is no exact match, strings match in another case, as in a NOT CASESPECIFIC column'''
 
-                            else: changelist[f] += 1
+    def __init__(self, values):
 
-                        file.close()
+        self.exact, self.upper = {}, {}
 
-                if len(changelist.keys()) == 0: print('None found')
+        for value in values:
 
-               
+            self.exact.setdefault(key_value(value), value)
 
-        changelist = {}
+            if isinstance(value, str): self.upper.setdefault(key_value(value).upper(), value)
 
-        find_replace('C:', 'J:', changelist)
+ 
 
-        find_replace('P00', '$$Env$$', changelist)
+    def __contains__(self, value):
 
-        find_replace('OMEG8844', 'OMEG8770', changelist)
+        value = key_value(value)
 
-        find_replace('7019', '7018', changelist)
+        return value in self.exact or isinstance(value, str) and value.upper() in self.upper
 
  
 
-        if len(changelist.keys()) > 0:
+    def find(self, value):
 
-            print(f'DDL/SQL updated in {len(changelist.keys())} files:')
+        '''return the key value (as read by the first query) that value is; value must be in self'''
 
-            for k in sorted(changelist.keys()):
+        value = key_value(value)
 
-                print(k)
+        return self.exact[value] if value in self.exact else self.upper[value.upper()]
 
  
 
-    def semicolon(self):
-
-        '''check last char in file ends in a semicolon'''
+def write_result_block(evidence_file, columns, results, sample_size=1000):
 
-        def last_char_in_file(filename):
+    '''write a result set to an evidence file as a /* ... */ block of aligned rows, one row at a time
 
-            file = open(filename, "r")
+    column widths fit the column names and the first sample_size rows; longer values in later rows are written in full'''
 
-            filecontents = file.read().strip()
+    def text(value):
 
-            file.close()
+        return '?' if value is None else str(value)
 
-            return filecontents[-1:]
+    columns = [str(column).strip() for column in columns]
 
-        def last_line_in_file(filename):
+    widths = [len(column) for column in columns]
 
-            def list_from_file(filename):
+    rows = iter(results or [])
 
-                lines = []
+    sample = list(itertools.islice(rows, sample_size))
 
-                with open(filename) as file:
+    for row in sample:
 
-                    for line in file:
+        for i, value in enumerate(row[:len(widths)]): widths[i] = max(widths[i], len(text(value)))
 
-                        lines.append(line.strip())
+    evidence_file.write('/*\n')
 
-                return lines
+    evidence_file.write(' '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip() + '\n')
 
-            lines = list_from_file(filename)
+    evidence_file.write(' '.join('-' * width for width in widths) + '\n')
 
-            if len(lines) == 0:
+    for row in itertools.chain(sample, rows):
 
-                print(f'{filename} is empty')
+        evidence_file.write(' '.join(text(value).rjust(width) if isinstance(value, (int, float, decimal.Decimal)) else text(value).ljust(width)
 
-                return ''
+                                     for value, width in zip(row, widths)).rstrip() + '\n')
 
-            lastline = -1
+    evidence_file.write('*/\n')
 
-           while lines[lastline] == '': lastline -= 1 # ignore blank lines
+ 
 
-            return lines[lastline]
+class FileEntry:
 
-        def append_to_file(filename, txt):
+    '''one file of the release; everything the phases ask about a file is worked out once, when the release is read'''
 
-            file = open(filename, "a")
+    __slots__ = ('path', 'rel', 'name', 'suffix', 'teradata', 'size', 'mtime', 'seq')
 
-            file.write(txt)
+    def __init__(self, path, teradata_parent_path, seq):
 
-            file.close()
+        self.path, self.seq = path, seq
 
-        #for f in self.file_list:
+        self.rel = str(path).replace(str(teradata_parent_path), '') if teradata_parent_path is not None else str(path) #as written in deploy_items.txt
 
-        for f in self.synopsis_list:
+        self.name = path.name.lower()
 
-            if str(f).lower().endswith('.sql') or str(f).lower().endswith('.ddl'):
+        self.suffix = path.suffix.lower()
 
-                if last_char_in_file(f) != ';':
+        parts = pathlib.PurePath(self.rel).parts
 
-                    if '.IF ERRORCODE' not in last_line_in_file(f):
+        self.teradata = len(parts) > 1 and parts[1].upper() == 'TERADATA'
 
-                        print(f'{f} does not end with a semicolon')
+        stat = path.stat()
 
-                        append_to_file(f, ';')
+        self.size, self.mtime = stat.st_size, stat.st_mtime
 
  
 
-    def remove_BOM(self):
+class FileIndex:
 
-        '''Remove BOM from file if exists'''
+    '''the files of a release in file list order, with lookups by path, suffix, name and folder'''
 
-        def remove_BOM_from_file(path):
+    def __init__(self, file_list, teradata_path, teradata_parent_path):
 
-            size = os.path.getsize(path)
+        self.teradata_path, self.teradata_parent_path = teradata_path, teradata_parent_path
 
-            BOM_length = len(codecs.BOM_UTF8)
+        self.teradata_prefix = None if teradata_path is None else str(teradata_path).replace(str(teradata_parent_path), '')
 
-            with open(path, "r+b") as file:
+        self.entries, self.paths = [], {}
 
-                chunk = file.read(size)
+        self.suffixes, self.names, self.folders = collections.defaultdict(list), collections.defaultdict(list), collections.defaultdict(list)
 
-                if chunk.startswith(codecs.BOM_UTF8):
+        self.seq = 0
 
-                    chunk = chunk[BOM_length:]
+        for path in file_list: self.add(path)
 
-                    while chunk:
+ 
 
-                        file.seek(1)
+    def __iter__(self):
 
-                        file.write(chunk)
+        return iter(self.entries)
 
-                        file.seek(BOM_length, os.SEEK_CUR)
+ 
 
-                        chunk = file.read(size)
+    def __len__(self):
 
-                    file.seek(-BOM_length, os.SEEK_CUR)
+        return len(self.entries)
 
-                    file.truncate()
+ 
 
-                    return True
+    def add(self, path):
 
-                else:
+        '''add a file that was created after the release was read'''
 
-                    return False
+        path = pathlib.Path(path)
+
+        entry = FileEntry(path, self.teradata_parent_path, self.seq)
+
+        self.seq += 1
+
+        self.entries.append(entry)
+
+        self.paths[str(path)] = entry
+
+        self.suffixes[entry.suffix].append(entry)
+
+        self.names[entry.name].append(entry)
+
+        self.folders[str(path.parent)].append(entry)
+
+        return entry
+
+ 
+
+    def remove(self, path):
+
+        '''forget a file that was renamed or deleted after the release was read'''
+
+        entry = self.paths.pop(str(path), None)
+
+        if entry is None: return
+
+        for entries in (self.entries, self.suffixes[entry.suffix], self.names[entry.name], self.folders[str(entry.path.parent)]): entries.remove(entry)
+
+ 
+
+    def entry(self, path):
+
+        '''return the entry for path; files that are not in the index get an entry that is not added to it'''
+
+        return self.paths.get(str(path)) or FileEntry(pathlib.Path(path), self.teradata_parent_path, -1)
+
+ 
+
+    def with_suffix(self, *suffixes):
+
+        '''return the entries with one of the (lowercase) suffixes, in file list order'''
+
+        return sorted((entry for suffix in suffixes for entry in self.suffixes.get(suffix, [])), key=lambda entry: entry.seq)
+
+ 
+
+    def named(self, name):
+
+        '''return the entries with a file name (case insensitive), in file list order'''
+
+        return list(self.names.get(name.lower(), []))
+
+ 
+
+    def in_folder(self, folder):
+
+        '''return the entries directly in a folder, in file list order'''
+
+        return list(self.folders.get(str(pathlib.Path(folder)), []))
+
+ 
+
+    def teradata_relative(self, path):
+
+        '''return path relative to the TERADATA folder, as shown in the synopsis'''
+
+        entry = self.paths.get(str(path))
+
+        if entry is not None and self.teradata_prefix and entry.rel != str(path) and entry.rel.startswith(self.teradata_prefix):
+
+            return entry.rel[len(self.teradata_prefix):]
+
+        return str(path).replace(str(self.teradata_path), '')
+
+ 
+
+def staged_files(folder, skip=()):
+
+    '''yield the paths of the files in folder relative to it, leaving out .svn folders and the top level folders in skip'''
+
+    folder = pathlib.Path(folder)
+
+    for root, dirs, files in os.walk(folder):
+
+        relative = pathlib.Path(root).relative_to(folder)
+
+        dirs[:] = [d for d in dirs if d != '.svn' and not (relative == pathlib.Path('.') and d in skip)]
+
+        for file in files: yield relative / file
+
+ 
+
+class StagingArea:
+
+    '''local copy of a network work folder: the run works in the local folder and changed files are
+
+    copied back in bulk by sync(), in a background thread, and by finish() at the end of the run
+
+    releases: the folders svn checks out in the work folder; they are not copied to the local folder (svn checks them out there)
+
+    and only their files that change during the run are copied back; .svn folders are never copied'''
+
+    def __init__(self, remote, local, releases=()):
+
+        self.remote, self.local = pathlib.Path(remote), pathlib.Path(local)
+
+        self.remote_name = str(remote)
+
+        self.synced, self.errors, self.copied = {}, {}, 0 #errors: {folder: error of its last copy}
+
+        self.lock, self.thread = threading.Lock(), None
+
+        self.local.mkdir(parents=True, exist_ok=True)
+
+        copied = 0
+
+        if self.remote.is_dir(): #bring the local folder up to date with the work folder
+
+            for relative in staged_files(self.remote, releases):
+
+                remote_file, local_file = self.remote / relative, self.local / relative
+
+                stat = remote_file.stat()
+
+                if not local_file.is_file() or local_file.stat().st_size != stat.st_size or abs(local_file.stat().st_mtime - stat.st_mtime) > 2:
+
+                    local_file.parent.mkdir(parents=True, exist_ok=True)
+
+                    shutil.copy2(remote_file, local_file)
+
+                    copied += 1
+
+                self.synced[str(relative)] = (stat.st_size, stat.st_mtime)
+
+        for release in releases: #as checked out by an earlier run, only files changed from now on are copied back
+
+            for relative in staged_files(self.local / release):
+
+                stat = (self.local / release / relative).stat()
+
+                self.synced[str(release / relative)] = (stat.st_size, stat.st_mtime)
+
+        print(f'Staging folder     : {self.local} ({copied} files copied from {self.remote})')
+
+ 
+
+    def changed_files(self):
+
+        '''return the local files that are new or changed since they were last synced, grouped by folder'''
+
+        changed = collections.defaultdict(list)
+
+        for relative in staged_files(self.local):
+
+            stat = (self.local / relative).stat()
+
+            synced = self.synced.get(str(relative))
+
+            if synced is None or synced[0] != stat.st_size or abs(synced[1] - stat.st_mtime) > 2:
+
+                changed[relative.parent].append((relative, stat))
+
+        return changed
+
+ 
+
+    def copy_changed_files(self):
+
+        '''copy new and changed files to the work folder, one folder at a time'''
+
+        with self.lock:
+
+            for folder, files in sorted(self.changed_files().items()):
+
+                try:
+
+                    (self.remote / folder).mkdir(parents=True, exist_ok=True)
+
+                    for relative, stat in files:
+
+                        shutil.copy2(self.local / relative, self.remote / relative)
+
+                        self.synced[str(relative)] = (stat.st_size, stat.st_mtime)
+
+                        self.copied += 1
+
+                except OSError as e:
+
+                    self.errors[folder] = f'{self.remote / folder}: {e}'
+
+                else: self.errors.pop(folder, None) #copied by a later sync
+
+ 
+
+    def sync(self):
+
+        '''copy changed files to the work folder in a background thread (one copy at a time)'''
+
+        if self.thread is not None and self.thread.is_alive(): return #the final sync picks up anything this one misses
+
+        self.thread = threading.Thread(target=self.copy_changed_files, daemon=True)
+
+        self.thread.start()
+
+ 
+
+    def finish(self):
+
+        '''wait for any background copy, copy the remaining changes and return True if every copy succeeded'''
+
+        if self.thread is not None: self.thread.join()
+
+        self.copy_changed_files()
+
+        for error in self.errors.values(): print(f'ERROR: sync failed: {error}')
+
+        print(f'Staging folder     : {self.copied} files copied to {self.remote}')
+
+        return not self.errors
+
+ 
+
+class ReleaseManifest:
+
+    '''file sizes, mtimes and content hashes of a checked out release plus the per-file parse results and
+
+    derived artifacts of the last run; files with an unchanged content hash reuse the stored parse results'''
+
+    def __init__(self, filename, root, full=False, last=None):
+
+        '''last: the manifest of the previous run in this process (--daemon), used instead of reading the file it saved'''
+
+        self.filename, self.root = pathlib.Path(filename), pathlib.Path(root)
+
+        self.previous, self.previous_artifacts, self.files, self.artifacts = {}, {}, {}, {}
+
+        self.prefetched = set() #(relative, kind) parsed by store(), not counted as reused
+
+        self.changed, self.deleted, self.reused = [], [], collections.Counter()
+
+        self.saved_mtime = None
+
+        self.lock = threading.RLock() #the environments of -z --environments parse on threads of their own
+
+        if not full and last is not None and self.filename.is_file() and self.filename.stat().st_mtime == last.saved_mtime:
+
+            self.previous, self.previous_artifacts = last.files, last.artifacts
+
+        elif not full and self.filename.is_file():
+
+            try:
+
+                with open(self.filename, encoding='utf-8') as f:
+
+                    manifest = json.load(f)
+
+                self.previous, self.previous_artifacts = manifest['files'], manifest['artifacts']
+
+            except (OSError, ValueError, KeyError):
+
+                print(f'WARNING: unable to read {self.filename}, redoing every phase')
+
+ 
+
+    def relative(self, filename):
+
+        '''return the path of filename relative to the release root, or None if it is outside the root'''
+
+        try: return str(pathlib.Path(filename).relative_to(self.root))
+
+        except ValueError: return None
+
+ 
+
+    def update(self, files):
+
+        '''compare the size and mtime of every file in a FileIndex, hashing only files whose size or mtime changed
+
+        return True if no file was added, changed or deleted since the last run'''
+
+        for entry in files:
+
+            relative = self.relative(entry.path)
+
+            old = self.previous.get(relative)
+
+            if old and old['size'] == entry.size and old['mtime'] == entry.mtime:
+
+                self.files[relative] = old
+
+                continue
+
+            sha1 = hashlib.sha1(entry.path.read_bytes()).hexdigest()
+
+            unchanged = old is not None and old['sha1'] == sha1
+
+            if not unchanged: self.changed.append(relative)
+
+            self.files[relative] = {'size': entry.size, 'mtime': entry.mtime, 'sha1': sha1, 'parsed': old['parsed'] if unchanged else {}}
+
+        self.deleted = [relative for relative in self.previous if relative not in self.files]
+
+        print(f'Manifest           : {len(self.files)} files, {len(self.changed)} new/changed and {len(self.deleted)} deleted since the last run')
+
+        return self.unchanged()
+
+ 
+
+    def unchanged(self):
+
+        return bool(self.previous) and not self.changed and not self.deleted
+
+ 
+
+    def parsed(self, filename, kind, parse):
+
+        '''return parse(filename), reusing the result stored for an unchanged file'''
+
+        entry = self.files.get(self.relative(filename))
+
+        if entry is None: return parse(filename)
+
+        with self.lock:
+
+            if kind in entry['parsed']:
+
+                if (self.relative(filename), kind) in self.prefetched: self.prefetched.discard((self.relative(filename), kind))
+
+                else: self.reused[kind] += 1
+
+                return entry['parsed'][kind]
+
+        result = json.loads(json.dumps(parse(filename))) #same types as results read back from the manifest
+
+        with self.lock: return entry['parsed'].setdefault(kind, result)
+
+ 
+
+    def unparsed(self, filelist, kind):
+
+        '''return the files in filelist that parsed() would have to parse'''
+
+        with self.lock:
+
+            return [filename for filename in filelist if kind not in self.files.get(self.relative(filename), {'parsed': {kind: None}})['parsed']]
+
+ 
+
+    def store(self, filename, kind, result):
+
+        '''store a result parsed elsewhere (e.g. in a process pool) for parsed() to return'''
+
+        with self.lock:
+
+            self.files[self.relative(filename)]['parsed'][kind] = json.loads(json.dumps(result))
+
+            self.prefetched.add((self.relative(filename), kind))
+
+ 
+
+    def save(self):
+
+        with self.lock, open(self.filename, 'w', encoding='utf-8') as f:
+
+            json.dump({'files': self.files, 'artifacts': self.artifacts}, f)
+
+        self.saved_mtime = self.filename.stat().st_mtime
+
+        if self.reused: print(f"Reused from manifest: {', '.join(f'{kind} {n}x' for kind, n in sorted(self.reused.items()))}")
+
+ 
+
+class MetadataCache:
+
+    '''on-disk cache of catalog query results with a TTL and an LRU size bound
+
+    keys are "environment|kind|object", e.g. "T05|COLUMNS|DWT05V_ODS.ACCOUNT"'''
+
+    def __init__(self, filename, ttl_hours, max_entries, refresh=False):
+
+        self.filename, self.ttl, self.max_entries = pathlib.Path(filename), ttl_hours * 3600, max_entries
+
+        self.entries, self.hits, self.misses, self.dirty = collections.OrderedDict(), 0, 0, False
+
+        self.lock = threading.Lock() #shared by worker sessions
+
+        if refresh:
+
+            print(f'Metadata cache refreshed: {self.filename}')
+
+            self.dirty = True
+
+        elif self.filename.is_file():
+
+            try:
+
+                with open(self.filename, encoding='utf-8') as f:
+
+                    self.entries = collections.OrderedDict(json.load(f))
+
+            except (OSError, ValueError):
+
+                print(f'WARNING: unable to read metadata cache {self.filename}, starting with an empty cache')
+
+ 
+
+    def key(self, environment, kind, obj):
+
+        '''return the cache key for a catalog object'''
+
+        return f'{environment}|{kind}|{obj}'.upper()
+
+ 
+
+    def get(self, key):
+
+        '''return cached results or None if missing or expired'''
+
+        with self.lock:
+
+            entry = self.entries.get(key)
+
+            if entry is not None and time.time() - entry['time'] > self.ttl:
+
+                del self.entries[key]
+
+                self.dirty, entry = True, None
+
+            if entry is None:
+
+                self.misses += 1
+
+                return None
+
+            self.entries.move_to_end(key)
+
+            self.hits += 1
+
+            return entry['results']
+
+ 
+
+    def put(self, key, results):
+
+        '''store results, evicting the least recently used entries above max_entries'''
+
+        with self.lock:
+
+            self.entries[key] = {'time': time.time(), 'results': [list(row) for row in results]}
+
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+
+                self.entries.popitem(last=False)
+
+            self.dirty = True
+
+ 
+
+    def save(self):
+
+        '''write the cache to disk if anything changed'''
+
+        if not self.dirty: return
+
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_filename = self.filename.with_suffix('.tmp')
+
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+
+            json.dump(self.entries, f, default=str)
+
+        os.replace(tmp_filename, self.filename)
+
+        self.dirty = False
+
+ 
+
+class RowCountBaselines:
+
+    '''last exact row count of each table with its catalog signature (LastAlterTimeStamp, CurrentPerm) when it was counted,
+
+    kept in "<evidence file>.baselines.json"; the count of a table whose signature has not changed is carried forward
+
+    DML does not always change the signature (DBC has nothing that every load updates), so only tables the release does not deploy are carried'''
+
+    def __init__(self, evidence_filename):
+
+        self.filename = pathlib.Path(str(evidence_filename) + '.baselines.json')
+
+        self.baselines = {}
+
+        if self.filename.is_file():
+
+            try:
+
+                with open(self.filename, encoding='utf-8') as f:
+
+                    self.baselines = json.load(f)
+
+            except (OSError, ValueError):
+
+                print(f'WARNING: unable to read {self.filename}, counting all tables')
+
+ 
+
+    def carried(self, db, ob, signature):
+
+        '''return the baseline of db.ob if its signature is unchanged, otherwise None'''
+
+        baseline = self.baselines.get(f'{db}.{ob}'.upper())
+
+        if baseline is not None and None not in signature and baseline['signature'] == signature: return baseline
+
+        return None
+
+ 
+
+    def put(self, db, ob, count, signature):
+
+        self.baselines[f'{db}.{ob}'.upper()] = {'count': int(count), 'signature': signature, 'counted_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
+
+ 
+
+    def save(self):
+
+        with open(self.filename, 'w', encoding='utf-8') as f:
+
+            json.dump(self.baselines, f, indent=1)
+
+ 
+
+class ObjectIndex:
+
+    '''sqlite index of the tables/views defined in the TERADATA folder of every release read by a run, for --which
+
+    object names are kept as written, e.g. DW$$ENV$$V_ODS.ACCOUNT, and looked up by key(), which maps names with an environment
+
+    (DWT05V_ODS.ACCOUNT) to the same key'''
+
+    ENVIRONMENT = re.compile(r'^DW(?:\$\$ENV\$\$|[A-Z][0-9]{2})')
+
+    def __init__(self, filename):
+
+        pathlib.Path(filename).parent.mkdir(parents=True, exist_ok=True)
+
+        self.db = sqlite3.connect(str(filename), timeout=30) #another run may be writing
+
+        self.db.executescript('''
+
+            CREATE TABLE IF NOT EXISTS releases (root TEXT PRIMARY KEY, release TEXT, dwh TEXT, first_indexed TEXT, last_indexed TEXT);
+
+            CREATE TABLE IF NOT EXISTS files (root TEXT, file TEXT, sha1 TEXT, PRIMARY KEY (root, file));
+
+            CREATE TABLE IF NOT EXISTS objects (object_key TEXT, object TEXT, root TEXT, file TEXT, statement TEXT, seq INTEGER);
+
+            CREATE INDEX IF NOT EXISTS objects_by_key ON objects (object_key);
+
+            CREATE INDEX IF NOT EXISTS objects_by_file ON objects (root, file);''')
+
+ 
+
+    @classmethod
+
+    def key(cls, name):
+
+        return cls.ENVIRONMENT.sub('DW$$ENV$$', name.upper().replace('"', '').strip())
+
+ 
+
+    def changed(self, root, sha1s):
+
+        '''return the files in {file: sha1} that were added or changed since the release in the root folder was last indexed'''
+
+        indexed = dict(self.db.execute('SELECT file, sha1 FROM files WHERE root = ?', (root,)))
+
+        return [file for file, sha1 in sha1s.items() if indexed.get(file) != sha1]
+
+ 
+
+    def update(self, root, release, dwh, sha1s, definitions):
+
+        '''index a release: sha1s is {file: sha1} for all its files, definitions is {file: [(object, statement), ...]} for
+
+        the files changed() returned; files that are no longer in the release are removed from the index'''
+
+        now = datetime.datetime.now().isoformat(' ', 'seconds')
+
+        with self.db: #one transaction
+
+            indexed = [file for (file,) in self.db.execute('SELECT file FROM files WHERE root = ?', (root,))]
+
+            for file in [file for file in indexed if file not in sha1s] + list(definitions):
+
+                self.db.execute('DELETE FROM files WHERE root = ? AND file = ?', (root, file))
+
+                self.db.execute('DELETE FROM objects WHERE root = ? AND file = ?', (root, file))
+
+            for file, objects in definitions.items():
+
+                self.db.execute('INSERT INTO files VALUES (?, ?, ?)', (root, file, sha1s[file]))
+
+                self.db.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?)',
+
+                                    [(self.key(ob), ob, root, file, statement, seq) for seq, (ob, statement) in enumerate(objects)])
+
+            self.db.execute('''INSERT INTO releases VALUES (?, ?, ?, ?, ?)
+
+                               ON CONFLICT (root) DO UPDATE SET release = excluded.release, dwh = excluded.dwh, last_indexed = excluded.last_indexed''',
+
+                            (root, release, dwh, now, now))
+
+ 
+
+    def find(self, name):
+
+        '''return [(first_indexed, dwh, release, statement, object, file, sha1), ...] for every definition of a table/view,
+
+        the release indexed most recently first; % in name is a wildcard'''
+
+        key = self.key(name)
+
+        if '%' in key: condition, key = "LIKE ? ESCAPE '\\'", key.replace('\\', '\\\\').replace('_', '\\_')
+
+        else: condition = '= ?'
+
+        return self.db.execute(f'''
+
+            SELECT r.first_indexed, r.dwh, r.release, o.statement, o.object, o.file, f.sha1
+
+            FROM objects o JOIN releases r ON r.root = o.root JOIN files f ON f.root = o.root AND f.file = o.file
+
+            WHERE o.object_key {condition}
+
+            ORDER BY r.first_indexed DESC, r.root, o.file, o.seq''', (key,)).fetchall()
+
+ 
+
+    def close(self):
+
+        self.db.close()
+
+ 
+
+class QueryFailed(Exception):
+
+    '''Teradata_query returned None, which is how it reports a failed query'''
+
+ 
+
+class Checkpoint:
+
+    '''progress of a -z evidence file, one JSON line per object in "<evidence file>.checkpoint":
+
+    {"object": ..., "status": "done"|"failed", "error": ..., "offset": evidence file size, "exported": result sets exported}
+
+    with resume, the objects before the first failed one are skipped and the evidence file is cut where the evidence of the first
+
+    failed object starts; it and every object after it are run again, so the evidence stays in order and has no failed attempts'''
+
+    def __init__(self, evidence_filename, resume=False):
+
+        self.evidence_filename = pathlib.Path(evidence_filename)
+
+        self.filename = pathlib.Path(str(evidence_filename) + '.checkpoint')
+
+        self.objects, self.offset, self.exported = {}, 0, 0
+
+        records = []
+
+        if resume and self.filename.is_file() and self.evidence_filename.is_file():
+
+            with open(self.filename, encoding='utf-8') as f:
+
+                for line in f:
+
+                    try: records.append(json.loads(line))
+
+                    except ValueError: break #last line cut off
+
+        kept = records[:next((n for n, record in enumerate(records) if record['status'] == 'failed'), len(records))]
+
+        for record in kept:
+
+            self.objects[record['object']] = record
+
+            self.offset, self.exported = record['offset'], record['exported']
+
+        self.resumed = bool(self.objects)
+
+        if records:
+
+            print(f'\nResuming           : {len(kept)} objects done, {len(records)-len(kept)} run again from the first failed one: {self.evidence_filename}')
+
+        if self.resumed: #the checkpoint of the objects run again is written again
+
+            with open(self.filename, 'w', encoding='utf-8') as f:
+
+                f.writelines(json.dumps(record) + '\n' for record in kept)
+
+        elif self.filename.exists(): self.filename.unlink()
+
+        self.failed = 0
+
+ 
+
+    def done(self, ob):
+
+        return self.objects.get(ob, {}).get('status') == 'done'
+
+ 
+
+    def open_evidence(self, encoding=None):
+
+        '''open the evidence file: empty, or when resuming, cut after the last object skipped'''
+
+        if not self.resumed: return open(self.evidence_filename, 'w', encoding=encoding)
+
+        evidence_file = open(self.evidence_filename, 'r+', encoding=encoding)
+
+        evidence_file.seek(self.offset)
+
+        evidence_file.truncate()
+
+        return evidence_file
+
+ 
+
+    def exporter(self, parquet):
+
+        return ResultExporter(self.evidence_filename, parquet, self.exported if self.resumed else None)
+
+ 
+
+    def record(self, ob, evidence_file, exporter, error=None):
+
+        '''record that the evidence of ob has been written (or that ob failed with error)'''
+
+        evidence_file.flush()
+
+        record = {'object': ob, 'status': 'failed' if error else 'done', 'error': error, 'offset': evidence_file.tell(), 'exported': exporter.count}
+
+        with open(self.filename, 'a', encoding='utf-8') as f:
+
+            f.write(json.dumps(record) + '\n')
+
+        self.objects[ob] = record
+
+        if error: self.failed += 1
+
+ 
+
+class ResultExporter:
+
+    '''write every result set of an evidence .sql file to "<evidence file>/NNNN_<name>.csv" (and .parquet)
+
+    _index.csv lists each result set with its row count and the inferred column types'''
+
+    def __init__(self, evidence_filename, parquet=False, resume_after=None):
+
+        '''with resume_after, keep the first resume_after result sets of the last run and export after them'''
+
+        self.directory = pathlib.Path(evidence_filename).with_suffix('')
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        if parquet and pyarrow is None: print('WARNING: pyarrow is not installed, results are exported as CSV only')
+
+        self.parquet, self.count = parquet and pyarrow is not None, 0
+
+        index_rows = []
+
+        if resume_after is not None and (self.directory / '_index.csv').is_file():
+
+            with open(self.directory / '_index.csv', newline='', encoding='utf-8') as f:
+
+                index_rows = list(csv.reader(f))[1:resume_after+1]
+
+            self.count = len(index_rows)
+
+            for filename in self.directory.glob('[0-9][0-9][0-9][0-9]_*'): #result sets of objects that did not finish
+
+                if int(filename.name[:4]) > self.count: filename.unlink()
+
+        self.index = open(self.directory / '_index.csv', 'w', newline='', encoding='utf-8')
+
+        self.index_writer = csv.writer(self.index)
+
+        self.index_writer.writerow(['seq', 'name', 'file', 'rows', 'columns'])
+
+        self.index_writer.writerows(index_rows)
+
+ 
+
+    @staticmethod
+
+    def column_type(values):
+
+        '''return the type of a column: integer, decimal, float, date, timestamp, string or null'''
+
+        types = {type(value) for value in values if value is not None}
+
+        if not types: return 'null'
+
+        if types <= {int}: return 'integer'
+
+        if types <= {int, decimal.Decimal}: return 'decimal'
+
+        if types <= {int, float}: return 'float'
+
+        if types <= {datetime.date}: return 'date'
+
+        if types <= {datetime.datetime}: return 'timestamp'
+
+        return 'string'
+
+ 
+
+    def write(self, name, columns, results):
+
+        '''write one result set'''
+
+        self.count += 1
+
+        columns = [str(column).strip() for column in columns]
+
+        rows = [list(row) for row in results or []]
+
+        values = [[row[i] for row in rows] for i in range(len(columns))]
+
+        types = [self.column_type(column_values) for column_values in values]
+
+        safe_name = re.sub(r'[^\w.-]', '_', name)
+
+        filename = self.directory / f'{self.count:04}_{safe_name}.csv'
+
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+
+            writer = csv.writer(f)
+
+            writer.writerow(columns)
+
+            for row in rows:
+
+                writer.writerow(['' if value is None else value for value in row])
+
+        if self.parquet:
+
+            arrays = []
+
+            for column_values, column_type in zip(values, types):
+
+                if column_type == 'string': column_values = [None if value is None else str(value) for value in column_values]
+
+                if column_type == 'decimal':
+
+                    column_values = [None if value is None else decimal.Decimal(value) for value in column_values]
+
+                    scale = max([-value.as_tuple().exponent for value in column_values if value is not None] + [0])
+
+                    arrays.append(pyarrow.array(column_values, type=pyarrow.decimal128(38, scale)))
+
+                else: arrays.append(pyarrow.array(column_values))
+
+            pyarrow.parquet.write_table(pyarrow.Table.from_arrays(arrays, names=columns), filename.with_suffix('.parquet'))
+
+        self.index_writer.writerow([self.count, name, filename.name, len(rows), ';'.join(f'{c}:{t}' for c, t in zip(columns, types))])
+
+ 
+
+    def close(self):
+
+        self.index.close()
+
+ 
+
+class Task:
+
+    '''a step of a run, see TaskGraph'''
+
+    def __init__(self, name, run, inputs, outputs, interactive):
+
+        self.name, self.run, self.interactive = name, run, interactive
+
+        self.inputs, self.outputs = set(inputs), set(outputs)
+
+        self.depends_on, self.ancestors, self.seconds = [], set(), None
+
+ 
+
+class TaskGraph:
+
+    '''steps of a run with the resources (files, folders, shared state) they read and write
+
+    a step depends on the earlier steps that write what it reads, and on the earlier steps that read or write what it writes,
+
+    so running every step once the steps it depends on have finished gives the same results as running them in the order they were added
+
+    an interactive step (it may prompt) runs on its own: it starts once the running steps have finished, and no other step is started until it finishes'''
+
+    def __init__(self):
+
+        self.tasks = []
+
+ 
+
+    def add(self, name, run, inputs=(), outputs=(), interactive=False):
+
+        task = Task(name, run, inputs, outputs, interactive)
+
+        for earlier in self.tasks:
+
+            if task.inputs & earlier.outputs or task.outputs & (earlier.inputs | earlier.outputs):
+
+                task.depends_on.append(earlier)
+
+                task.ancestors |= earlier.ancestors | {earlier}
+
+        self.tasks.append(task)
+
+        return task
+
+ 
+
+    def show(self):
+
+        '''print every step with what it reads and writes and the steps it waits for (leaving out the ones it waits for indirectly)'''
+
+        print(f'Task graph         : {len(self.tasks)} steps')
+
+        for task in self.tasks:
+
+            after = [t.name for t in task.depends_on if not any(t in other.ancestors for other in task.depends_on)]
+
+            print(f"  {task.name}{' (interactive)' if task.interactive else ''}")
+
+            if task.inputs: print(f"    reads          : {', '.join(sorted(task.inputs))}")
+
+            if task.outputs: print(f"    writes         : {', '.join(sorted(task.outputs))}")
+
+            if after: print(f"    after          : {', '.join(after)}")
+
+ 
+
+    def show_times(self):
+
+        print(f"Step times         : {', '.join(f'{task.name} {task.seconds:.1f}s' for task in self.tasks if task.seconds is not None)}")
+
+ 
+
+    def run(self, workers):
+
+        '''run the steps on up to workers threads, each one as soon as the steps it depends on have finished
+
+        an exception (or exit()) in a step stops further steps from starting and is raised again once the running steps have finished'''
+
+        def timed(task):
+
+            start = time.time()
+
+            try: task.run()
+
+            finally: task.seconds = time.time() - start
+
+        pending, running, done, error = list(self.tasks), {}, set(), None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+
+            while running or (pending and error is None):
+
+                for task in list(pending):
+
+                    if error is not None or len(running) >= max(1, workers) or any(t.interactive for t in running.values()): break
+
+                    if not all(t in done for t in task.depends_on): continue
+
+                    if task.interactive and running: break #nothing else starts until the running steps finish and it has run
+
+                    pending.remove(task)
+
+                    running[pool.submit(timed, task)] = task
+
+                    if task.interactive: break
+
+                for future in concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED).done:
+
+                    task = running.pop(future)
+
+                    try: future.result()
+
+                    except BaseException as e:
+
+                        if error is None: error = e
+
+                    else: done.add(task)
+
+        if error is not None: raise error
+
+ 
+
+class DWHTestInit:
+
+    '''Initialize testing for an EDW JIRA development or PRD'''
+
+    row_count_alias = [' #', ' name', ' total', ' method']
+
+    DDL_replacements = [('C:', 'J:'), ('P00', '$$Env$$'), ('OMEG8844', 'OMEG8770'), ('7019', '7018')] #production text: test text, see DDL_replace_text()
+
+    def __init__(self, argv=None, resident=None):
+
+        '''(1) Checkout code
+
+           (2) Validate/create deploy_items.txt
+
+           (3) Do more things
+
+        argv: arguments instead of sys.argv; resident: the Daemon running this as a job, which keeps
+
+        sessions, parsed .ini files, manifests and the metadata cache between jobs'''
+
+        #hardcoded values
+
+        self.g_drive='\\\\ilife400\home'
+
+        self.test_doc_templates_dir = pathlib.Path(f'{self.g_drive}\Projects\_templates')
+
+        self.resident = resident
+
+        self.default_inifilename, self.general_config_name = 'EDWTAU.ini', 'EDWTAU'
+
+        self.state_dir = pathlib.Path.home() / '.DWHTestInit' #local files kept between runs
+
+       
+
+        inifilename, configname, self.post_load_test, self.args = self.get_args(argv)
+
+        if self.args.which: #no .ini file or database session needed
+
+            self.which(self.args.which)
+
+            return
+
+        if resident is None or not resident.templates_checked:
+
+            assert(self.test_doc_templates_dir.is_dir())
+
+            if resident is not None: resident.templates_checked = True
+
+        if inifilename == None: inifilename = self.default_inifilename
+
+        self.ini = self.read_ini(inifilename, configname)
+
+        self.staging = None
+
+        if self.args.stage is not None: #work in a local folder, copy the results to work_folder
+
+            stage_folder = self.args.stage or pathlib.Path(tempfile.gettempdir()) / 'DWHTestInit' / self.ini['dwh']
+
+            releases = [self.ini[key].rstrip('/').split('/')[-1] for key in self.ini if key.startswith('svn') and self.ini[key].startswith('https')]
+
+            self.staging = StagingArea(self.ini['work_folder'], stage_folder, releases)
+
+            self.ini['work_folder'] = str(self.staging.local)
+
+        self.current_dir = pathlib.Path.cwd()
+
+        if resident is not None and resident.sessions: #logged on by an earlier job
+
+            self.session, self.sessions = resident.sessions[0], resident.sessions
+
+        else:
+
+            self.session = self.logon()
+
+            self.sessions = [self.session] #session pool for concurrent queries, see worker_sessions()
+
+            if resident is not None: resident.sessions = self.sessions
+
+        if resident is not None and resident.metadata_cache is not None and not self.args.refresh_cache:
+
+            self.metadata_cache = resident.metadata_cache
+
+        else:
+
+            self.metadata_cache = MetadataCache(self.state_dir / 'metadata_cache.json', self.args.cache_ttl, self.args.cache_size, self.args.refresh_cache)
+
+            if resident is not None: resident.metadata_cache = self.metadata_cache
+
+ 
+
+        self.explained = {} #query: (estimated seconds, estimated rows), see explain()
+
+        self.manifest = None
+
+        self.watch_targets = [] #--watch: (checkout_target_dir, teradata_path, multi_svn_id)
+
+        graph = TaskGraph()
+
+        graph.add('test_docs', self.test_docs, outputs={'test_docs'})
+
+        svnkeys, multi_svn_id = [], '' #multiple SVN locations
+
+        for key in self.ini:
+
+            if key.startswith('svn'): svnkeys.append(key)
+
+        for svnkey in svnkeys:
+
+            multi_svn_id = f'_{pathlib.Path(self.ini[svnkey]).name}'
+
+            if self.ini[svnkey].startswith('https'):
+
+                self.add_release_tasks(graph, self.ini[svnkey], multi_svn_id)
+
+            else:
+
+                if self.ini[svnkey] == '': print('No SVN location has been specifed')
+
+                else:
+
+                    print(f"SVN: '{self.ini[svnkey]}'")
+
+                    for i in range(2, 20):
+
+                        if svnkey+1 in self.ini: print(f"SVN{i}: '{self.ini[svnkey+1]}'")
+
+                        else: break
+
+        graph.add('prd_folder_cmd', self.prd_folder_cmd, outputs={'prd_folder.cmd'})
+
+        if self.args.show_graph: graph.show()
+
+        graph.run(self.args.task_workers)
+
+        if self.args.show_graph: graph.show_times()
+
+        if self.args.watch:
+
+            if self.watch_targets: self.watch(self.watch_targets)
+
+            else: print('--watch: no TERADATA folder to watch')
+
+        self.metadata_cache.save()
+
+        print(f'Metadata cache     : {self.metadata_cache.hits} hits, {self.metadata_cache.misses} catalog queries')
+
+        if self.staging is not None and not self.staging.finish():
+
+            print(f'CRITICAL: results are only in {self.staging.local}, copying them to {self.staging.remote} failed');exit(1)
+
+        print('\nScript complete.')
+
+ 
+
+    def add_release_tasks(self, graph, svn_url, multi_svn_id):
+
+        '''add the steps for one SVN location to the task graph
+
+        the release state (self.files, self.teradata_path, self.manifest, self.synopsis_list, ...) is shared by every location:
+
+        the steps that use it read or write the "release" and "deploy_items" resources, so each location waits for the one before
+
+        the steps that parse files write the "parse" resource: they store results in the manifest and may start a --parse_workers pool'''
+
+        release_folder = svn_url.split('/')[-1:][0]
+
+        checkout_target_dir = self.ini['work_folder'] + '\\' + release_folder
+
+        synopsis_file = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_synopsis{multi_svn_id}.txt")
+
+        dependency_graph_file = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_dependencies{multi_svn_id}.csv")
+
+       
+
+        def read_release():
+
+            '''get paths, file lists etc from checked out application code'''
+
+            self.deploy_items_path, self.synopsis_list = None, None
+
+            self.release_unchanged = self.read_release(checkout_target_dir, multi_svn_id)
+
+           
+
+        def deploy_items():
+
+            if self.teradata_path is None or self.teradata_parent_path is None: return
+
+            previous = self.manifest.previous_artifacts
+
+            if self.release_unchanged and previous.get('synopsis_list') is not None and previous.get('teradata_path') == str(self.teradata_path):
+
+                self.deploy_items_path = pathlib.Path(previous['deploy_items_path'])
+
+                self.synopsis_list = [pathlib.Path(f) for f in previous['synopsis_list']]
+
+                print(f'deploy_items.txt   : unchanged since the last run, validation skipped: {self.deploy_items_path}')
+
+            else:
+
+                self.deploy_items_path, self.synopsis_list = self.validate_create_deploy_items(multi_svn_id)
+
+            self.manifest.artifacts.update({'teradata_path': str(self.teradata_path), 'deploy_items_path': str(self.deploy_items_path),
+
+                                            'synopsis_list': None if self.synopsis_list is None else [str(f) for f in self.synopsis_list]})
+
+           
+
+        def synopsis():
+
+            if self.synopsis_list is None: return
+
+            if self.release_unchanged and synopsis_file.is_file(): print(f'Synopsis           : unchanged since the last run: {synopsis_file}')
+
+            else: self.synopsize(self.synopsis_list, synopsis_file, multi_svn_id)
+
+           
+
+        def dependency_graph():
+
+            if self.synopsis_list is not None: self.write_dependency_graph(self.synopsis_list, dependency_graph_file)
+
+           
+
+        def check_databases_exist():
+
+            if self.synopsis_list is not None: self.check_databases_exist()
+
+           
+
+        def DDL_replace_text():
+
+            if self.synopsis_list is not None: self.DDL_replace_text()
+
+           
+
+        def init_deploy():
+
+            if self.synopsis_list is None: return
+
+            self.init_deploy(multi_svn_id)
+
+            self.watch_targets.append((checkout_target_dir, self.teradata_path, multi_svn_id))
+
+           
+
+        def post_load():
+
+            # this only runs if -z switch used
+
+            if self.synopsis_list is None: return
+
+            query_row_counts_filename = pathlib.Path(self.ini['work_folder']) / 'Test Scripts' / pathlib.Path(f"{self.ini['dwh']}_row_counts{multi_svn_id}.sql")
+
+            query_data_checks_filename = pathlib.Path(self.ini['work_folder']) / 'Test Scripts' / pathlib.Path(f"{self.ini['dwh']}_data_checks{multi_svn_id}.sql")
+
+            if self.args.environments:
+
+                self.create_environment_matrix(self.synopsis_list, multi_svn_id)
+
+            elif self.args.pipeline:
+
+                self.run_post_load_pipeline(self.synopsis_list, query_row_counts_filename, query_data_checks_filename)
+
+            else:
+
+                self.create_query_row_counts(self.synopsis_list, query_row_counts_filename)
+
+                self.create_query_data_checks(self.synopsis_list, query_data_checks_filename)
+
+               
+
+        def stage_phase_done(phase): #after the steps of this location added so far
+
+            return graph.add(f'stage_{phase}{multi_svn_id}', self.stage_phase_done,
+
+                             inputs=set().union(*(task.outputs for task in graph.tasks[first:])), outputs={'staging'})
+
+           
+
+        first = len(graph.tasks)
+
+        if not self.post_load_test:
+
+            graph.add(f'checkout{multi_svn_id}', lambda: self.checkout(svn_url, self.ini['work_folder']), outputs={release_folder}, interactive=True)
+
+        graph.add(f'read_release{multi_svn_id}', read_release, inputs={release_folder}, outputs={'release'}, interactive=True) #may ask for the TERADATA folder
+
+        graph.add(f'deploy_items{multi_svn_id}', deploy_items, inputs={'release'}, outputs={'release', 'deploy_items'})
+
+        graph.add(f'update_object_index{multi_svn_id}', self.update_object_index, inputs={'release', 'deploy_items'}, outputs={'object_index.sqlite', 'parse'})
+
+        if not self.post_load_test:
+
+            graph.add(f'synopsis{multi_svn_id}', synopsis, inputs={'release', 'deploy_items'}, outputs={synopsis_file.name, 'parse'})
+
+            graph.add(f'dependency_graph{multi_svn_id}', dependency_graph, inputs={'release', 'deploy_items'}, outputs={dependency_graph_file.name, 'parse'})
+
+            graph.add(f'check_databases_exist{multi_svn_id}', check_databases_exist, inputs={'release', 'deploy_items'}, outputs={'session', 'parse'})
+
+            stage_phase_done('checks')
+
+            #graph.add(f'remove_BOM{multi_svn_id}', self.remove_BOM, inputs={'release'}, outputs={'release'})
+
+            #graph.add(f'semicolon{multi_svn_id}', self.semicolon, inputs={'release'}, outputs={'release'})
+
+            graph.add(f'DDL_replace_text{multi_svn_id}', DDL_replace_text, inputs={'release', 'deploy_items'}, outputs={'release', 'parse'}, interactive=True)
+
+            graph.add(f'init_deploy{multi_svn_id}', init_deploy, inputs={'release', 'deploy_items'}, outputs={'deploy', 'watch_targets', 'parse'})
+
+            stage_phase_done('deploy')
+
+        else: #evidence goes to the Test Scripts folder copied from the templates
+
+            graph.add(f'post_load{multi_svn_id}', post_load, inputs={'release', 'deploy_items', 'test_docs'}, outputs={'session', 'Test Scripts', 'parse'})
+
+            stage_phase_done('post_load')
+
+        outputs = set().union(*(task.outputs for task in graph.tasks[first:]))
+
+        graph.add(f'save_manifest{multi_svn_id}', lambda: self.manifest.save(), inputs=outputs, outputs={'manifest'}) #after every other step of this location
+
+ 
+
+    def check_databases_exist(self):
+
+        '''check that databases exist'''
+
+        AELO_dict = self.get_AELO_dict(self.file_list)
+
+        dbs, dbs_not_found = [], []
+
+        for table, database_list in AELO_dict.items():
+
+            for db in database_list:
+
+                if db not in dbs: dbs.append(db)
+
+        for db in sorted(dbs):
+
+            query = f"SELECT DatabaseName FROM DBC.Databases WHERE DatabaseName = '{db}';"
+
+            results = self.cached_query('database', db, query)
+
+            if results is not None:
+
+                if len(results) == 0: #0 rows returned, db not found
+
+                    print(f'WARNING: db does not exist: {db}')
+
+                    dbs_not_found.append(db)
+
+                elif len(results) == 1: #db found
+
+                    db_found = results[0][0].strip().upper()
+
+                    assert db_found in dbs
+
+                elif len(results) > 1: #more than 1 db found? impossible
+
+                    print(f'These results are most unusual:\n{results}');exit()
+
+            else:
+
+                print(f'CRITICAL: db does not exist: {db}');
+
+        if len(dbs_not_found) == 0: print('All dbs exist.')
+
+ 
+
+    def write_results(self, evidence_file, exporter, name, columns, results):
+
+        '''write a result set to an evidence .sql file as a comment block and export it to CSV/parquet'''
+
+        if self.args.stream_evidence: write_result_block(evidence_file, columns, results, self.args.stream_sample)
+
+        else: evidence_file.write('/*\n'+teradata_funcs.teradata_funcs.format_results(columns, results)+'*/\n')
+
+        exporter.write(name, columns, results)
+
+ 
+
+    def write_evidence(self, evidence_file, exporter, evidence):
+
+        '''write a list of query text and (name, columns, results) result sets to an evidence .sql file'''
+
+        for item in evidence:
+
+            if isinstance(item, str): evidence_file.write(item)
+
+            else: self.write_results(evidence_file, exporter, *item)
+
+ 
+
+    def worker_sessions(self, n):
+
+        '''return n database sessions, logging on more sessions if needed; the first one is self.session'''
+
+        while len(self.sessions) < n:
+
+            self.sessions.append(self.logon())
+
+        return self.sessions[:n]
+
+ 
+
+    def logon(self, dsn='DWHDR'):
+
+        '''return a new database session; a session the daemon keeps for later jobs logs on again if it is lost, see ResidentSession'''
+
+        return teradata_funcs.teradata_funcs(dsn) if self.resident is None else ResidentSession(dsn)
+
+ 
+
+    def published(self, text):
+
+        '''return text with paths in the local staging folder and on the G: share written as they are seen on G:'''
+
+        if self.staging is not None: text = text.replace(str(self.staging.local), self.staging.remote_name)
+
+        return text.replace(self.g_drive, 'G:')
+
+ 
+
+    def stage_phase_done(self):
+
+        '''with --stage_sync phase, start copying the results of the phase that just finished to the work folder'''
+
+        if self.staging is not None and self.args.stage_sync == 'phase': self.staging.sync()
+
+ 
+
+    def parse_files(self, filelist, kind, parse):
+
+        '''with --parse_workers, parse the files that parsed() would parse one by one in a process pool first
+
+        parse must be a module level function; results are stored in file order, so the output is the same as a serial parse
+
+        fewer than --parse_min_files files are left to parsed(): starting the pool would cost more than it saves'''
+
+        if self.manifest is None or self.args.parse_workers < 2: return
+
+        unparsed = self.manifest.unparsed(filelist, kind)
+
+        if len(unparsed) < self.args.parse_min_files: return
+
+        start = time.time()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.args.parse_workers) as pool:
+
+            results = pool.map(parse, unparsed, chunksize=max(1, len(unparsed) // (self.args.parse_workers * 4)))
+
+            for filename, result in zip(unparsed, results): self.manifest.store(filename, kind, result)
+
+        print(f"{'Parsed ' + kind:<19}: {len(unparsed)} files on {self.args.parse_workers} processes in {time.time()-start:.1f}s")
+
+ 
+
+    def parsed(self, filename, kind, parse):
+
+        '''return parse(filename), reusing the result from the last run if the file is unchanged'''
+
+        if self.manifest is None: return parse(filename)
+
+        return self.manifest.parsed(filename, kind, parse)
+
+ 
+
+    def cached_query(self, kind, obj, query, session=None):
+
+        '''run a catalog query or return its results from the metadata cache
+
+        empty results are not cached, so objects that do not exist yet are looked up again'''
+
+        key = self.metadata_cache.key(self.ini['environment'], kind, obj)
+
+        results = self.metadata_cache.get(key)
+
+        if results is None:
+
+            results = (session or self.session).Teradata_query(query)
+
+            if results: self.metadata_cache.put(key, results)
+
+        return results
+
+ 
+
+    def run_query(self, query, session=None):
+
+        '''run a -z query and return its results; raise QueryFailed if it failed, so the object is not recorded as done'''
+
+        results = (session or self.session).Teradata_query(query)
+
+        if results is None: raise QueryFailed(f'query failed: {query[:200]}')
+
+        return results
+
+ 
+
+    def update_object_index(self):
+
+        '''add the tables/views defined by the release to the object index in state_dir, see --which
+
+        only files added or changed since the release was last indexed are parsed'''
+
+        if self.synopsis_list is None: return
+
+        sha1s = {}
+
+        for filename in self.synopsis_list:
+
+            entry = self.manifest.files.get(self.manifest.relative(filename))
+
+            if entry is not None: sha1s[self.manifest.relative(filename)] = entry['sha1']
+
+        try:
+
+            index = ObjectIndex(self.state_dir / 'object_index.sqlite')
+
+            try:
+
+                changed = index.changed(str(self.manifest.root), sha1s)
+
+                filenames = [self.manifest.root / relative for relative in changed]
+
+                self.parse_files(filenames, 'definitions', object_definitions)
+
+                definitions = {relative: self.parsed(filename, 'definitions', object_definitions) for relative, filename in zip(changed, filenames)}
+
+                index.update(str(self.manifest.root), self.manifest.root.name, self.ini['dwh'], sha1s, definitions)
+
+            finally: index.close()
+
+        except sqlite3.Error as e:
+
+            print(f'WARNING: unable to update the object index: {e}')
+
+            return
+
+        print(f'Object index       : {len(changed)} of {len(sha1s)} files indexed')
+
+ 
+
+    def which(self, name):
+
+        '''--which: print the releases and files that define a table/view, from the object index'''
+
+        index = ObjectIndex(self.state_dir / 'object_index.sqlite')
+
+        try: rows = index.find(name)
+
+        finally: index.close()
+
+        if not rows:
+
+            print(f'{name} is not defined in any indexed release')
+
+            return
+
+        print(f'Object index       : {len(rows)} definitions of {name}, the release indexed most recently first')
+
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]) - 1)]
+
+        for row in rows:
+
+            print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)) + f'  {row[-1][:12]}')
+
+ 
+
+    def prd_folder_cmd(self):
+
+        '''create a .cmd file that opens the prd_folder'''
+
+        if 'prd_folder' not in self.ini: return
+
+        prd_folder_cmd_filename = pathlib.Path(self.ini['work_folder']) / pathlib.Path('prd_folder.cmd')
+
+        if prd_folder_cmd_filename.exists(): return
+
+        file = open(prd_folder_cmd_filename, "w")
+
+        file.write(f'explorer "{self.ini["prd_folder"]}\c. Systems Testing"')
+
+        file.close()
+
+ 
+
+    def test_docs(self):
+
+        '''copy the test doc templates and generate the test documents
+
+        they only depend on the ini, so this step runs while the release is checked out, parsed and checked; errors do not stop the run'''
+
+        try: self.copy_test_doc_templates(self.ini['work_folder'])
+
+        except (Exception, SystemExit): print(f'ERROR: copying the test doc templates / generating the test documents failed:\n{traceback.format_exc()}')
+
+ 
+
+    def copy_test_doc_templates(self, checkout_target_dir):
+
+        '''copy test doc templates to target folder only if the folder does not exist already
+
+           filenames in the template directoy must have a "template_" prefix to be recognized'''
+
+        def template_rename(d, filename_root):
+
+            '''return 2 paths: (1) template file name (2) DWH-NNNNN file name'''
+
+            template_name = pathlib.Path(d) / f'template_{filename_root}'
+
+            DWH_name = pathlib.Path(d) / f'{self.ini["dwh"]}_{filename_root}'
+
+            if template_name.is_file() and not DWH_name.exists():
+
+                print(f'Renaming {template_name} to {DWH_name}')
+
+                template_name.rename(DWH_name)
+
+                with open(DWH_name) as f:
+
+                    s = f.read()
+
+                with open(DWH_name, 'w') as f:
+
+                    s = s.replace('DWH-NNNNN', self.ini["dwh"]).replace('$$ENV$$', self.ini['environment'])
+
+                    f.write(s)
+
+            #check if .docx files exist in their respective folders
+
+            for dt in ['Test Approach', 'Test Plan', 'Test Report']:
+
+                if dt == d.name and dt.replace(' ','_') in DWH_name.name and not DWH_name.is_file():
+
+                    for target_dir in fullpath_test_doc_dirs:
+
+                        if dt in str(target_dir):
+
+                            target_file = target_dir / DWH_name.name
+
+                            if target_file.is_file():
+
+                                print(f'{target_file} already exists and will not be overwritten.')
+
+                            if not target_file.is_file():
+
+                                print(f'{target_file} does not exist. Creating...')
+
+                                doctypes.append(dt)
+
+                            break
+
+       
+
+        test_doc_dirs = ['Test Approach', 'Test Evidence', 'Test Plan', 'Test Report', 'Test Scripts']
+
+        test_documents = ['Test_Approach.docx','Test_Plan.docx','Test_Report.docx']
+
+        test_scripts_files = ['01_SELECT.template.sql','02_DELETE.sql','03_SELECT_NON_KEY_VALUES.template.sql','04_UPDATE_NON_KEY_VALUES.sql', \
+
+                            '05_SELECT_KEY_VALUES.template.sql','06_UPDATE_KEY_VALUES.sql','07_SELECT_DELETED_KEY_VALUES.template.sql', \
+
+                            'associated_objects.sql','duplicates.template.sql','ExtractionType_Initial.sql','ExtractionType_Regular.sql','JIRATestScript.csv']
+
+        fullpath_test_doc_dirs = [pathlib.Path(checkout_target_dir) / x for x in test_doc_dirs]
+
+        fullpath_test_doc_templates = [pathlib.Path(self.test_doc_templates_dir) / x for x in test_doc_dirs]
+
+        doctypes = [] #should contain 0 or more of 'Test Approach', 'Test Plan', 'Test Report'
+
+        for d, template in zip(fullpath_test_doc_dirs, fullpath_test_doc_templates):
+
+            if not d.is_dir(): shutil.copytree(template, d) #only create directory (and copy files) if the directory doesn't exist
+
+            #filename_root values should exist as "template_[filename_root]" in the self.test_doc_templates_dir directory
+
+            for filename_root in test_documents+test_scripts_files:
+
+                #print(f'renaming template_{filename_root} to {filename_root}')
+
+                #template_rename(template, filename_root)
+
+                template_rename(d, filename_root)
+
+        if doctypes: DWHTestDocGenerator.DWHTestDocGenerator(doctypes, self.ini)
+
+ 
+
+    def init_deploy(self, multi_svn_id):
+
+        '''get ready to (but don't actually) deploy the application'''
+
+        def write_install_ini(deploy_directory):
+
+            filename = deploy_directory / "install.ini"
+
+            try:
+
+                file = open(filename, "w")
+
+                file.seek(0)
+
+                file.truncate()
+
+                lines_of_text = ["[CONFIG]\n", "SOURCE_DIR=.\n", f"dataSourceName={self.session.DSN}\n",
+
+                    f"TARGET_ENV={self.ini['environment']}\n", "TARGET_ENVS=T02\n", "TARGET_ENVP=B00\n",
+
+                    "BTEQ=True\n", "FIX_DOLLAR=True\n", "logLevel=INFO\n", "logConsole=True\n", "logDir=.\Log\n"]
+
+                file.writelines(lines_of_text)
+
+                file.close()
+
+            except:
+
+                raise NameError(f"unable to create {filename}")
+
+ 
+
+        deploy_directory = pathlib.Path(self.ini['work_folder']) / pathlib.Path("deploy")
+
+        pathlib.Path(deploy_directory).mkdir(parents=True, exist_ok=True) # make target directory
+
+        write_install_ini(deploy_directory)
+
+        td_install_path = self.current_dir / 'td_install.py'
+
+        shutil.copy(td_install_path, deploy_directory)
+
+        td_install_command = f'python td_install.py --appName={self.ini["dwh"]} --SOURCE_DIR="{self.teradata_path}" --OBJECT_LIST="{self.deploy_items_path}"'
+
+        td_install_command = self.published(td_install_command)
+
+        deploy_cmd_filename = deploy_directory / pathlib.Path(f"{self.ini['dwh']}_deploy{multi_svn_id}.cmd")
+
+       
+
+        GCFR_Log_directory = deploy_directory / 'Log'
+
+        Deployment_directory = pathlib.Path(self.ini['work_folder']) / 'Test Evidence' / 'Deployment'
+
+        copy_log_command = f'IF %ERRORLEVEL% EQU 0 copy "{GCFR_Log_directory}\\{self.ini["dwh"]}*.log" "{Deployment_directory}"'
+
+        copy_log_command = self.published(copy_log_command)
+
+        deploy_cmd_filename.write_text(td_install_command + '\n' + copy_log_command)
+
+        print(f'Deploy using: {deploy_cmd_filename}')
+
+       
+
+        #dependency-ordered deploy plan: the objects in each wave can be deployed concurrently
+
+        waves = self.deploy_waves()
+
+        deploy_waves_cmd_filename = deploy_directory / pathlib.Path(f"{self.ini['dwh']}_deploy_waves{multi_svn_id}.cmd")
+
+        lines = []
+
+        for wave_number, wave in enumerate(waves, 1):
+
+            chunks = [wave[i::self.args.deploy_parallel] for i in range(min(self.args.deploy_parallel, len(wave)))]
+
+            commands = []
+
+            for chunk_number, chunk in enumerate(chunks, 1):
+
+                wave_id = f'wave{wave_number:02}_{chunk_number}'
+
+                object_list = deploy_directory / f"{self.ini['dwh']}_{wave_id}{multi_svn_id}.txt"
+
+                object_list.write_text(''.join(f'{seq}|{deploy_item}\n' for seq, deploy_item in chunk))
+
+                commands.append(f'python td_install.py --appName={self.ini["dwh"]}_{wave_id} --SOURCE_DIR="{self.teradata_path}" --OBJECT_LIST="{object_list}"')
+
+            lines.append(f'REM wave {wave_number}: {len(wave)} objects in {len(chunks)} parallel deploys')
+
+            if len(commands) == 1: lines.append(commands[0])
+
+            else: lines.append('(' + ' & '.join(f'start "{self.ini["dwh"]} wave {wave_number}" /b cmd /c {command}' for command in commands) + ') | pause >nul') #pause returns when every started deploy has ended
+
+        lines.append(copy_log_command)
+
+        deploy_waves_cmd_filename.write_text(self.published('\n'.join(lines)))
+
+        print(f'Deploy in {len(waves)} dependency-ordered waves using: {deploy_waves_cmd_filename}')
+
+       
+
+    def deploy_item_files(self):
+
+        '''return [(seq, deploy_item, filename), ...] for the entries in deploy_items.txt'''
+
+        deploy_items = []
+
+        with open(self.deploy_items_path) as f:
+
+            for line in f:
+
+                if '|' in line:
+
+                    seq, deploy_item = line.rstrip('\n').split('|', 1)
+
+                    deploy_items.append((seq, deploy_item, pathlib.Path(os.path.normpath(os.path.join(str(self.teradata_path), deploy_item)))))
+
+        return deploy_items
+
+ 
+
+    def deployed_objects(self):
+
+        '''return {(database, object)} for the tables/views created by the deploy_items.txt entries (the release's deploy set), or None without deploy_items.txt'''
+
+        if self.deploy_items_path is None: return None
+
+        return {(db, ob) for ob, db in self.iter_AELO([filename for seq, deploy_item, filename in self.deploy_item_files() if filename.is_file()])}
+
+ 
+
+    def deploy_waves(self):
+
+        '''group deploy_items.txt entries into waves: every entry only depends on entries in earlier waves
+
+        an entry depends on the entries that create the objects it references, and on earlier entries that create the same object
+
+        entries in a dependency cycle are deployed one by one in deploy_items.txt order in a final wave
+
+        return [[(seq, deploy_item), ...], ...]
+
+        object names are matched with the DDL_replace_text() replacements applied and $$ENV$$ resolved (see resolve_name()),
+
+        so DWP00V_ODS.ACCOUNT, DW$$ENV$$V_ODS.ACCOUNT and DWT05V_ODS.ACCOUNT in a T05 run are the same object'''
+
+        deploy_item_files = self.deploy_item_files()
+
+        deploy_items = [(seq, deploy_item) for seq, deploy_item, filename in deploy_item_files]
+
+        created, references = {}, []
+
+        for n, (seq, deploy_item, filename) in enumerate(deploy_item_files):
+
+            objects, refs = [], set()
+
+            if filename.is_file():
+
+                objects = [self.resolve_name(dependency[0]) for dependency in self.parsed(filename, 'dependencies', parse_dependencies)]
+
+                refs = {self.resolve_name(ref) for ref in self.parsed(filename, 'references', lambda filename: sorted(referenced_objects(filename)))}
+
+            for ob in objects:
+
+                created.setdefault(ob, []).append(n)
+
+            references.append((objects, refs))
+
+        depends_on = []
+
+        for n, (objects, refs) in enumerate(references):
+
+            deps = {m for ref in refs for m in created.get(ref, []) if m != n and (ref not in objects or m < n)}
+
+            depends_on.append(deps)
+
+        wave_of, remaining = {}, set(range(len(deploy_items)))
+
+        while remaining:
+
+            deployed = set(wave_of)
+
+            ready = [n for n in sorted(remaining) if depends_on[n] <= deployed]
+
+            if not ready: break
+
+            for n in ready:
+
+                wave_of[n] = 1 + max([wave_of[m] for m in depends_on[n]] + [0])
+
+            remaining -= set(ready)
+
+        waves = [[] for wave in range(max(wave_of.values(), default=0))]
+
+        for n in sorted(wave_of):
+
+            waves[wave_of[n]-1].append(deploy_items[n])
+
+        for n in sorted(remaining): #dependency cycle: one entry per wave
+
+            print(f'WARNING: {deploy_items[n][1]} is in or depends on a dependency cycle, deploying it on its own')
+
+            waves.append([deploy_items[n]])
+
+        return waves
+
+       
+
+    def resolve_name(self, name):
+
+        '''return an object name as it is in this run's environment: with the DDL_replace_text() replacements applied, whether or
+
+        not they were made in the file yet, and $$ENV$$ replaced by the environment, e.g. DWP00V_ODS.ACCOUNT -> DWT05V_ODS.ACCOUNT'''
+
+        name = name.upper()
+
+        for findtxt, replacetxt in self.DDL_replacements: name = name.replace(findtxt.upper(), replacetxt.upper())
+
+        return name.replace('$$ENV$$', self.ini['environment'].upper())
+
+       
+
+    def DDL_replace_text(self):
+
+        '''replace production references with test references'''
+
+        def find_replace(findtxt, replacetxt, changelist):
+
+            def replace_text(filename, old_text, new_text):
+
+                with open(filename) as f:
+
+                    s = f.read()
+
+                    if old_text not in s:
+
+                        print('"{old_text}" not found in {filename} ... WARNING'.format(**locals()))
+
+                        return
+
+                with open(filename, 'w') as f:
+
+                    print("Replace\t\"{old_text}\" with \"{new_text}\" in {filename} ... ".format(**locals()), end='')
+
+                    s = s.replace(old_text, new_text)
+
+                    f.write(s)
+
+                    print("OK")
+
+                   
+
+            askreplace = False
+
+            for entry in self.files.with_suffix('.sql', '.ddl'):
+
+                if findtxt in self.parsed(entry.path, 'replace_text', find_texts): #files unchanged since the last run are not read again
+
+                    print(entry.path)
+
+                    askreplace = True
+
+                    break
+
+            if askreplace and self.ask_YNQ(f"Replace {findtxt} with {replacetxt}", "n"):
+
+                for entry in self.files.with_suffix('.sql', '.ddl'):
+
+                    f = entry.path
+
+                    file = open(f, "r")
+
+                    filedata = file.read()
+
+                    if findtxt in filedata:
+
+                        print()
+
+                        replace_text(f, findtxt, replacetxt)
+
+                        if not f in changelist: changelist[f] = 1
+
+                        else: changelist[f] += 1
+
+                    file.close()
+
+                if len(changelist.keys()) == 0: print('None found')
+
+               
+
+        def find_texts(filename):
+
+            '''return the find texts that occur in a file'''
+
+            with open(filename, "r") as file:
+
+                filedata = file.read()
+
+            return [findtxt for findtxt, replacetxt in replacements if findtxt in filedata]
+
+ 
+
+        changelist = {}
+
+        replacements = self.DDL_replacements
+
+        for findtxt, replacetxt in replacements:
+
+            find_replace(findtxt, replacetxt, changelist)
+
+ 
+
+        if len(changelist.keys()) > 0:
+
+            print(f'DDL/SQL updated in {len(changelist.keys())} files:')
+
+            for k in sorted(changelist.keys()):
+
+                print(k)
+
+ 
+
+    def semicolon(self):
+
+        '''check last char in file ends in a semicolon'''
+
+        def last_char_in_file(filename):
+
+            file = open(filename, "r")
+
+            filecontents = file.read().strip()
+
+            file.close()
+
+            return filecontents[-1:]
+
+        def last_line_in_file(filename):
+
+            def list_from_file(filename):
+
+                lines = []
+
+                with open(filename) as file:
+
+                    for line in file:
+
+                        lines.append(line.strip())
+
+                return lines
+
+            lines = list_from_file(filename)
+
+            if len(lines) == 0:
+
+                print(f'{filename} is empty')
+
+                return ''
+
+            lastline = -1
+
+            while lines[lastline] == '': lastline -= 1 # ignore blank lines
+
+            return lines[lastline]
+
+        def append_to_file(filename, txt):
+
+            file = open(filename, "a")
+
+            file.write(txt)
+
+            file.close()
+
+        #for f in self.file_list:
+
+        for f in self.synopsis_list:
+
+            if self.files.entry(f).suffix in ('.sql', '.ddl'):
+
+                if last_char_in_file(f) != ';':
+
+                    if '.IF ERRORCODE' not in last_line_in_file(f):
+
+                        print(f'{f} does not end with a semicolon')
+
+                        append_to_file(f, ';')
+
+ 
+
+    def remove_BOM(self):
+
+        '''Remove BOM from file if exists'''
+
+        def remove_BOM_from_file(path):
+
+            size = os.path.getsize(path)
+
+            BOM_length = len(codecs.BOM_UTF8)
+
+            with open(path, "r+b") as file:
+
+                chunk = file.read(size)
+
+                if chunk.startswith(codecs.BOM_UTF8):
+
+                    chunk = chunk[BOM_length:]
+
+                    while chunk:
+
+                        file.seek(1)
+
+                        file.write(chunk)
+
+                        file.seek(BOM_length, os.SEEK_CUR)
+
+                        chunk = file.read(size)
+
+                    file.seek(-BOM_length, os.SEEK_CUR)
+
+                    file.truncate()
+
+                    return True
+
+                else:
+
+                    return False
+
+       
+
+        for f in self.file_list:
+
+            if remove_BOM_from_file(f):
+
+                print(f'BOM removed from {f}')
+
+ 
+
+    def ask(self, question):
+
+        '''ask a question and return the answer; jobs run by --daemon are not interactive and get an empty answer'''
+
+        if self.resident is not None:
+
+            print(f'{question} (no answer: run by --daemon)')
+
+            return ''
+
+        return input(f'{question} ')
+
+ 
+
+    def ask_YNQ(self, question, default_enter):
+
+        '''ask a YES/NO/QUIT question'''
+
+        default = ''
+
+        if default_enter != '': default = f'[ENTER = {default_enter.upper()}] '
+
+        if self.resident is not None: #run by --daemon: take the default answer, or N
+
+            print(f'{question} (Y/N/Q) {default}? {default_enter.upper() or "N"} (run by --daemon)')
+
+            return default_enter.strip().upper() == 'Y'
+
+        while True:
+
+            result = input(f'{question} (Y/N/Q) {default}? ')
+
+            result = result.strip().upper()
+
+            if result == '':
+
+                if default_enter != '': result = default_enter.strip().upper()
+
+            if result == 'Y': return True
+
+            if result == 'N': return False
+
+            if result == 'Q':
+
+                print('\nScript terminated.')
+
+                os._exit(0)
+
+ 
+
+    def svn_directory_and_file_lists(self, checkout_target_dir):
+
+        '''get list of dirs and files from target dir'''
+
+        def read(directory, dir_list, file_list):
+
+            '''recursive function: read dirs and files in a directory'''
+
+            for item in directory.iterdir():
+
+                #ignore these directories
+
+                if str(item).endswith('.svn'): continue
+
+                if str(item).endswith('Rollback'): continue
+
+                if str(item).endswith('Test Approach'): continue
+
+                if str(item).endswith('Test Evidence'): continue
+
+                if str(item).endswith('Test Plan'): continue
+
+                if str(item).endswith('Test Report'): continue
+
+                if str(item).endswith('Test Scripts'): continue
+
+                #add files and directories to lists
+
+                if item.is_file(): file_list.append(item)
+
+                if item.is_dir():
+
+                    dir_list.append(item)
+
+                    read(item, dir_list, file_list)
+
+            return dir_list, file_list
+
+       
+
+        dir_list, file_list = read(pathlib.Path(str(checkout_target_dir)), [], [])
+
+        if not dir_list: dir_list.append(checkout_target_dir)
+
+        return sorted(dir_list), sorted(file_list)
+
+ 
+
+    def iter_AELO(self, filelist, skip=()):
+
+        '''yield (object, database) for every database.[table|view] created in the release, in file order
+
+        "database.object" names in skip are left out'''
+
+        for filename in filelist:
+
+            for ob, db in self.parsed(filename, 'AELO', parse_AELO_file):
+
+                db = db.replace('$$ENV$$', self.ini['environment'])
+
+                if f'{db}.{ob}' not in skip: yield ob, db
+
+ 
+
+    def get_dependency_graph(self, filelist):
+
+        '''return {"database.object": {"type": "table"|"view", "refs": [...], "trivial": bool, "file": filename}}
+
+        for every table/view created in the release, with $$ENV$$ resolved'''
+
+        graph = {}
+
+        self.parse_files([filename for filename in filelist if filename.name != 'deploy_items.tmp'], 'dependencies', parse_dependencies)
+
+        for filename in filelist:
+
+            if filename.name == 'deploy_items.tmp': continue
+
+            for ob, object_type, refs, trivial in self.parsed(filename, 'dependencies', parse_dependencies):
+
+                ob = ob.replace('$$ENV$$', self.ini['environment'])
+
+                refs = [ref.replace('$$ENV$$', self.ini['environment']) for ref in refs]
+
+                graph[ob] = {'type': object_type, 'refs': refs, 'trivial': trivial, 'file': str(filename)}
+
+        return graph
+
+ 
+
+    def trivial_views(self, filelist):
+
+        '''return the set of "database.view" names that are a plain SELECT * over a table created in the release
+
+        counting and checking the table already verifies such views'''
+
+        graph = self.get_dependency_graph(filelist)
+
+        def base_table(ob, seen):
+
+            node = graph.get(ob)
+
+            if node is None or ob in seen: return None
+
+            if node['type'] == 'table': return ob
+
+            if not node['trivial']: return None
+
+            return base_table(node['refs'][0], seen | {ob})
+
+        return {ob for ob, node in graph.items() if node['type'] == 'view' and node['trivial'] and base_table(node['refs'][0], {ob})}
+
+ 
+
+    def write_dependency_graph(self, filelist, graph_filename):
+
+        '''write the release dependency graph as CSV: one row per object and referenced object'''
+
+        graph = self.get_dependency_graph(filelist)
+
+        with open(graph_filename, 'w', newline='') as f:
+
+            writer = csv.writer(f)
+
+            writer.writerow(['object', 'type', 'referenced_object', 'referenced_in_release', 'trivial', 'file'])
+
+            for ob, node in sorted(graph.items()):
+
+                for ref in node['refs'] or ['']:
+
+                    writer.writerow([ob, node['type'], ref, 'Y' if ref in graph else 'N' if ref else '', 'Y' if node['trivial'] else 'N', self.files.entry(node['file']).rel])
+
+        views = sum(1 for node in graph.values() if node['type'] == 'view')
+
+        print(f'Dependency graph   : {len(graph)-views} tables, {views} views: {graph_filename}')
+
+ 
+
+    def get_AELO_dict(self, filelist, skip_trivial_views=False):
+
+        '''get dictionary of all database.[table|view]s in release
+
+        "[table|view]name":["db1", "db2", "db3", "db4", "db5"]
+
+        with skip_trivial_views, views that are a plain SELECT * over a table in the release are left out'''
+
+        skip = self.trivial_views(filelist) if skip_trivial_views else set()
+
+        if skip: print(f'({len(skip)} trivial views skipped) ', end='')
+
+        AELO_dict = {} #key = database, value = table or view
+
+        self.parse_files(filelist, 'AELO', parse_AELO_file)
+
+        for ob, db in self.iter_AELO(filelist, skip):
+
+            if ob not in AELO_dict: AELO_dict[ob] = []
+
+            if db not in AELO_dict[ob]: AELO_dict[ob].append(db)#;print(ob,db)
+
+        #for k,v in AELO_dict.items(): print(k,v)
+
+        #exit()
+
+        return AELO_dict
+
+       
+
+    def data_check_columns(self, tablename, dbnames, session):
+
+        '''return (first_key, columns, column_list) for the data checks of a table/view: its first key column, the columns
+
+        it has in every database {column: number of databases} and the names of the result set columns'''
+
+        column_query = "SEL CAST(columnname AS VARCHAR(100)) FROM dbc.COLUMNS WHERE databasename='%s' AND TABLENAME='%s' AND columnname NOT IN ('start_date','end_date','start_ts','end_ts','record_deleted_flag','ctl_id','process_name','process_id','update_process_name','update_process_id') ORDER BY columnid;"
+
+        column_list, columns, first_key = ['name'], {}, None
+
+       
+
+        #GET PRIMARY KEY
+
+        query= f"SELECT COALESCE(Key_Column, '') FROM DW{self.ini['environment']}V_GCFR.GCFR_Transform_KeyCol WHERE Out_DB_Name = 'DW{self.ini['environment']}V_ODS_IN' AND Out_Object_Name = '{tablename}';"
+
+        primary_key_list = self.cached_query('keycol', tablename, query, session)
+
+        primary_key = []
+
+        for item in primary_key_list:
+
+            primary_key.append(item[0])
+
+        first_key = primary_key[0]
+
+       
+
+        for db in dbnames:
+
+            #print(f'-->{tablename}|{db}')
+
+            query = column_query % (db, tablename)
+
+            results = self.cached_query('columns', f'{db}.{tablename}', query, session)
+
+            for result in results:
+
+                key = result[0].strip(' ')
+
+                if key is None: continue
+
+                if not first_key: first_key = key
+
+                #print(first_key)
+
+                if key not in columns:
+
+                    column_list.append(key)
+
+                    columns[key] = 0
+
+                columns[key] += 1
+
+                #print(f'columns[{key}]={columns[key]}')
+
+       
+
+        #delete columns that are not in every db
+
+        delete_columns = []
+
+        for column_name, num in columns.items():
+
+            if num < len(dbnames): #column name is common to every identically named table/view in every database, so we can query it
+
+                if column_name not in delete_columns:
+
+                    delete_columns.append(column_name)
+
+            if len(column_name) > 29:
+
+                #returned column names have a max length of 30 (for some unknown reason...)
+
+                #therefore, any column name that is 30 characters long MAY be truncated, so, as a precaution, remove it
+
+                if column_name not in delete_columns:
+
+                    delete_columns.append(column_name)
+
+        for column_name in delete_columns:
+
+            del columns[column_name]
+
+            column_list.remove(column_name)
+
+        return first_key, columns, column_list
+
+ 
+
+    def key_discovery_queries(self, tablename, dbnames, first_key, key_discovery=None):
+
+        '''return the queries data_check_evidence starts the search for key values common to every database with:
+
+        TOP --num_values_to_check ... ORDER BY in every database, or (key_discovery 'sample') the first SAMPLE of the first database'''
+
+        if first_key is None: return []
+
+        if (key_discovery or self.args.key_discovery) == 'sample':
+
+            return [f"SEL {first_key} FROM {dbnames[0]}.{tablename} SAMPLE {min(self.args.num_values_to_check, self.args.max_values_to_find * 50)};"]
+
+        return [f"SEL TOP {self.args.num_values_to_check} {first_key} FROM {db}.{tablename} ORDER BY 1 ASC;" for db in dbnames]
+
+ 
+
+    def fingerprint_queries(self, tablename, dbnames, columns):
+
+        '''return one order-independent fingerprint query per database: row count and hash sums of the columns
+
+        the columns are hashed in their own types, so values that differ only past a length or in a precision that a cast would drop differ'''
+
+        hash_columns = [f'"{column}"' for column in columns]
+
+        hash_sums = [f"COALESCE(SUM(CAST(FROM_BYTES(HASHROW({', '.join(hash_columns[i:i+50])}), 'base10') AS DECIMAL(38,0))), 0)"
+
+                     for i in range(0, len(hash_columns), 50)] #HASHROW takes a limited number of expressions
+
+        return [f"SELECT CAST('{db}.{tablename}' AS VARCHAR(100)), CAST(COUNT(*) AS BIGINT)" + ''.join(f', {hash_sum}' for hash_sum in hash_sums) + f' FROM {db}.{tablename};'
+
+                for db in dbnames]
+
+ 
+
+    def data_check_queries(self, tablename, dbnames, session=None, key_discovery=None):
+
+        '''return the queries the data checks of a table/view start with, for the cost gate: the fingerprint queries (--data_check_mode fingerprint)
+
+        and the key discovery queries; the query for the rows of the key values found is checked when it is about to run'''
+
+        first_key, columns, column_list = self.data_check_columns(tablename, dbnames, session or self.session)
+
+        queries = self.fingerprint_queries(tablename, dbnames, columns) if self.args.data_check_mode == 'fingerprint' else []
+
+        return queries + self.key_discovery_queries(tablename, dbnames, first_key, key_discovery)
+
+ 
+
+    def data_check_evidence(self, tablename, dbnames, session, key_discovery=None):
+
+        '''generate and run the data check queries for one table/view in every database
+
+        key_discovery: 'top' or 'sample' instead of --key_discovery
+
+        return (evidence, status) where evidence is a list of query text and (name, columns, results) result sets'''
+
+        evidence, status = [], None
+
+       
+
+        def find_values_in_all_tables(tablename, dbnames):
+
+            '''find a value in a column common to all tables, return that value or None'''
+
+            num_values_to_check = self.args.num_values_to_check
+
+            find_common_value = []
+
+            max_values_to_find = self.args.max_values_to_find
+
+            for query in self.key_discovery_queries(tablename, dbnames, first_key, 'top'):
+
+                results = self.run_query(query, session)
+
+                clean_results = []
+
+                for result in results:
+
+                    clean_results.append(key_value(result[0]))
+
+                find_common_value.append(clean_results)
+
+                print(query+' --'+str(len(clean_results))+' rows returned')
+
+            found_values = []
+
+            if find_common_value[0] == []:
+
+                print('return (1)')
+
+                return []
+
+            other_values = [KeyValues(values) for values in find_common_value[1:]]
+
+            for value in find_common_value[0]:
+
+                for i in range(1, len(find_common_value)):
+
+                    if value not in other_values[i-1]:
+
+                        break
+
+                    else:
+
+                        if value not in found_values:
+
+                            found_values.append(value)
+
+                if len(found_values) == max_values_to_find:
+
+                    print('return (2)')
+
+                    return found_values
+
+            print('return (3)')
+
+            return found_values
+
+ 
+
+        def sample_values_in_all_tables(tablename, dbnames):
+
+            '''find values of first_key that exist in every database without sorting the key column:
+
+            sample the first database, then look the sampled values up in the other databases
+
+            the sample size doubles until max_values_to_find values are found or --sample_budget rows have been read'''
+
+            if first_key is None: return []
+
+            max_values_to_find, lookup_chunk = self.args.max_values_to_find, 500
+
+            sample_size, rows_read, checked, found_values = min(self.args.num_values_to_check, max_values_to_find * 50), 0, set(), []
+
+            while len(found_values) < max_values_to_find and rows_read < self.args.sample_budget:
+
+                query = f"SEL {first_key} FROM {dbnames[0]}.{tablename} SAMPLE {sample_size};"
+
+                sample = self.run_query(query, session)
+
+                rows_read += len(sample)
+
+                print(query+' --'+str(len(sample))+' rows returned')
+
+                candidates = []
+
+                for result in sample:
+
+                    if result[0] is None: continue
+
+                    value = key_value(result[0])
+
+                    if value not in checked:
+
+                        checked.add(value)
+
+                        candidates.append(value)
+
+                for i in range(0, len(candidates), lookup_chunk):
+
+                    common = candidates[i:i+lookup_chunk]
+
+                    for db in dbnames[1:]:
+
+                        in_list = ', '.join(sql_literal(value) for value in common)
+
+                        results = self.run_query(f"SEL {first_key} FROM {db}.{tablename} WHERE {first_key} IN ({in_list});", session)
+
+                        rows_read += len(common)
+
+                        matched = KeyValues(result[0] for result in results if result[0] is not None)
+
+                        common = [value for value in common if value in matched]
+
+                        if not common: break
+
+                    found_values.extend(common[:max_values_to_find-len(found_values)])
+
+                    if len(found_values) == max_values_to_find: break
+
+                if len(sample) < sample_size: break #the whole table has been sampled
+
+                sample_size *= 2
+
+            print(f'{len(found_values)} common values found in {rows_read} sampled/looked up rows')
+
+            return found_values
+
+ 
+
+        def fingerprints_match(tablename, dbnames, columns):
+
+            '''run one order-independent fingerprint query per database, add them to the evidence and
+
+            return True if row counts and hash sums are identical in every database'''
+
+            fingerprint_columns = ['name', 'rows'] + [f'fingerprint{i}' for i in range(1, (len(columns)+49)//50 + 1)]
+
+            fingerprints = []
+
+            queries = self.fingerprint_queries(tablename, dbnames, columns)
+
+            bundled = {}
+
+            for bundle in self.bundles(queries, lambda query: query): #one request for all databases
+
+                bundled.update(self.run_bundled(bundle, session))
+
+            for query in queries:
+
+                evidence.append('\n'+query+'\n')
+
+                results = bundled[query] if query in bundled else self.run_query(query, session)
+
+                if not results: return False
+
+                fingerprints.append(list(results[0]))
+
+            evidence.append((f'{tablename}_fingerprint', fingerprint_columns, fingerprints))
+
+            match = all(fingerprint[1:] == fingerprints[0][1:] for fingerprint in fingerprints)
+
+            evidence.append('--fingerprints match\n' if match else '--fingerprints differ, row-level checks follow\n')
+
+            return match
+
+       
+
+        first_key, columns, column_list = self.data_check_columns(tablename, dbnames, session)
+
+        if self.args.data_check_mode == 'fingerprint' and fingerprints_match(tablename, dbnames, columns):
+
+            return evidence, 'fingerprints match'
+
+        if (key_discovery or self.args.key_discovery) == 'sample': found_values = sample_values_in_all_tables(tablename, dbnames)
+
+        else: found_values = find_values_in_all_tables(tablename, dbnames)
+
+        if found_values == []:
+
+            status = 'has no data'
+
+        else:
+
+            #one query for every found value: the key (in its own type, as found) and database number columns put the rows
+
+            #in key order and are removed again when the rows are split into one result set per found value
+
+            conditions = []
+
+            in_list = ', '.join(sql_literal(found_value) for found_value in found_values if found_value is not None)
+
+            if in_list: conditions.append(f'{first_key} IN ({in_list})')
+
+            if None in found_values: conditions.append(f'{first_key} IS NULL')
+
+            select_columns = ''.join(f', Cast("{column}" AS VARCHAR(50))' for column in columns)
+
+            selects = [f"SELECT {first_key}, {n}, Cast('{db}.{tablename}' AS VARCHAR(50)){select_columns} FROM {db}.{tablename} WHERE {' OR '.join(conditions)}"
+
+                       for n, db in enumerate(dbnames, 1)]
+
+            query = ' UNION ALL '.join(selects) + ' ORDER BY 1, 2;'
+
+            evidence.append(query.replace('SELECT ', '\nSELECT ')+'\n')     #write query to file
+
+            gated = (self.args.cost_budget or self.args.spool_budget) and self.args.over_budget != 'defer' #cannot be deferred: the key values are found
+
+            try: reason = self.over_budget(*self.explain(query, session)) if gated else None
+
+            except Exception as e: reason = self.explain_failed(tablename, e)
+
+            if reason:
+
+                evidence.append(f'--not run, {reason}\n')
+
+                return evidence, f'data check query not run, {reason}'
+
+            results = self.run_query(query, session)                        #run query
+
+            results_by_value, keys = collections.defaultdict(list), KeyValues(found_values)
+
+            for result in results:
+
+                if result[0] in keys: results_by_value[keys.find(result[0])].append(result[2:])
+
+            for found_value in found_values:
+
+                evidence.append((f'{tablename}_{found_value}', column_list, results_by_value[found_value]))
+
+        return evidence, status
+
+ 
+
+    def check_object_data(self, tablename, dbnames, over_budget, session):
+
+        '''run the data checks of one table/view with data_check_evidence, as --over_budget says if it is in over_budget {object: reason}
+
+        return (evidence, status, error)'''
+
+        try:
+
+            if tablename in over_budget and self.args.over_budget == 'skip':
+
+                return [f'\n--skipped, {over_budget[tablename]}\n'], f'skipped, {over_budget[tablename]}', None
+
+            if tablename in over_budget and self.args.over_budget == 'sample':
+
+                return self.data_check_evidence(tablename, dbnames, session, 'sample') + (None,)
+
+            return self.data_check_evidence(tablename, dbnames, session) + (None,)
+
+        except Exception as e:
+
+            return [f'\n--ERROR: data check of {tablename} failed: {e}\n'], f'ERROR: data check failed: {e}', str(e)
+
+ 
+
+    def create_query_data_checks(self, filelist, query_filename):
+
+        '''generate AELO queries to be run post-load for ODS releases 2
+
+        use the -z switch to run this'''
+
+        print('Data check queries : ', end='')
+
+        AELO_dict = self.get_AELO_dict(filelist, self.args.skip_trivial_views) #key:value = "[table|view]name":["db1", "db2", "db3", "db4", "db5"]
+
+        #for tablename, dbnames in AELO_dict.items(): print(f'-->{tablename}|{dbnames}')
+
+        checkpoint = Checkpoint(query_filename, self.args.resume)
+
+        over_budget = self.cost_gate([tablename for tablename in AELO_dict if not checkpoint.done(tablename)], lambda tablename: self.data_check_queries(tablename, AELO_dict[tablename]))
+
+        if self.args.over_budget == 'defer': AELO_dict = dict(sorted(AELO_dict.items(), key=lambda item: item[0] in over_budget)) #over the budget last
+
+        AELO_query = checkpoint.open_evidence("utf-8")
+
+        exporter = checkpoint.exporter(self.args.parquet)
+
+        counter, statuses = 0, {} #statuses for the environment matrix
+
+        for tablename, dbnames in AELO_dict.items():
+
+            counter += 1
+
+            if checkpoint.done(tablename): continue
+
+            evidence, status, error = self.check_object_data(tablename, dbnames, over_budget, self.session)
+
+            self.write_evidence(AELO_query, exporter, evidence)
+
+            checkpoint.record(tablename, AELO_query, exporter, error)
+
+            statuses[tablename] = status or 'checked'
+
+            if status: print(f'{counter:03}/{len(AELO_dict):03}:{tablename} {status}')
+
+            #if counter == 2: exit()
 
        
 
-        for f in self.file_list:
+        AELO_query.close()
 
-            if remove_BOM_from_file(f):
+        exporter.close()
 
-                print(f'BOM removed from {f}')
+        if checkpoint.failed: print(f'({checkpoint.failed} failed, rerun with --resume to retry) ', end='')
+
+        print(query_filename)
+
+        return statuses
+
+ 
+
+    def create_environment_matrix(self, filelist, multi_svn_id):
+
+        '''-z with --environments: run the row counts and data checks in every environment at the same time, each on its own session,
+
+        with $$ENV$$ resolved to that environment and evidence in "<dwh>_row_counts<id>_<env>.sql" / "<dwh>_data_checks<id>_<env>.sql"
+
+        then write "<dwh>_environments<id>.csv": per object one row per database as in the DDL (with $$ENV$$), one column per environment'''
+
+        environments = []
+
+        for spec in self.args.environments.split(','):
+
+            environment, _, dsn = spec.partition('=')
+
+            environments.append((environment.strip().upper(), dsn.strip() or 'DWHDR')) #environment names are upper case, as in the ini
+
+        print(f"Environments       : {', '.join(f'{environment} ({dsn})' for environment, dsn in environments)}")
+
+        test_scripts = pathlib.Path(self.ini['work_folder']) / 'Test Scripts'
+
+        row_counts, data_checks, printed, output = {}, {}, {}, ThreadOutput(sys.stdout)
+
+        self.parse_files(filelist, 'AELO', parse_AELO_file) #once, before the environments share the manifest
+
+       
+
+        def run(environment, dsn):
+
+            '''run both suites in one environment, keeping what they print for the main thread'''
+
+            buffer, opened = output.capture(), []
+
+            try:
+
+                runner = copy.copy(self) #shares the manifest and the metadata cache (both locked), keys of which include the environment
+
+                runner.ini, runner.explained = dict(self.ini, environment=environment), {}
+
+                if (environment, dsn) == (self.ini['environment'].upper(), 'DWHDR'): runner.session = self.session
+
+                else:
+
+                    runner.session = teradata_funcs.teradata_funcs(dsn)
+
+                    opened.append(runner.session)
+
+                runner.sessions = [runner.session]
+
+                row_counts[environment] = runner.create_query_row_counts(filelist, test_scripts / f"{self.ini['dwh']}_row_counts{multi_svn_id}_{environment}.sql")
+
+                data_checks[environment] = runner.create_query_data_checks(filelist, test_scripts / f"{self.ini['dwh']}_data_checks{multi_svn_id}_{environment}.sql")
+
+            except Exception as e:
+
+                print(f'ERROR: environment {environment} ({dsn}) failed: {e}')
+
+            finally:
+
+                for session in opened: close_session(session)
+
+                output.release()
+
+                printed[environment] = buffer.getvalue()
+
+       
+
+        threads = [threading.Thread(target=run, args=environment) for environment in environments]
+
+        with contextlib.redirect_stdout(output):
+
+            for thread in threads: thread.start()
+
+            for thread in threads: thread.join()
+
+        for environment, dsn in environments:
+
+            print(f"{'Environment':<19}: {environment} ({dsn})")
+
+            print(printed.get(environment, ''), end='')
+
+       
+
+        totals = {environment: {} for environment, dsn in environments} #environment: {"database.object": total}
+
+        for environment, counts in row_counts.items():
+
+            for rows in counts.values():
+
+                for row in rows:
+
+                    totals[environment][str(row[1]).strip().upper()] = row[2]
+
+        AELO_dict = {} #object: [database as in the DDL, ...]
+
+        for filename in filelist:
+
+            for ob, db in self.parsed(filename, 'AELO', parse_AELO_file):
+
+                if db not in AELO_dict.setdefault(ob, []): AELO_dict[ob].append(db)
+
+        matrix_filename = pathlib.Path(self.ini['work_folder']) / f"{self.ini['dwh']}_environments{multi_svn_id}.csv"
+
+        different, objects = [], 0
+
+        with open(matrix_filename, 'w', newline='') as f:
+
+            writer = csv.writer(f)
+
+            writer.writerow(['object', 'database'] + [environment for environment, dsn in environments] + ['match'])
+
+            for ob, dbs in AELO_dict.items():
+
+                if not any(ob in counts for counts in row_counts.values()) and not any(ob in statuses for statuses in data_checks.values()): continue #skipped
+
+                objects += 1
+
+                for db in dbs:
+
+                    row = [totals[environment].get(f"{db.replace('$$ENV$$', environment)}.{ob}".upper(), '') for environment, dsn in environments]
+
+                    match = '' if '' in row else 'Y' if len(set(row)) == 1 else 'N'
+
+                    if match == 'N' and ob not in different: different.append(ob)
+
+                    writer.writerow([ob, db] + row + [match])
+
+                writer.writerow([ob, '(data check)'] + [data_checks.get(environment, {}).get(ob, '') for environment, dsn in environments] + [''])
+
+        print(f'Environment matrix : {objects} objects, {len(different)} with different row counts: {matrix_filename}')
+
+        for ob in different: print(f' {ob}')
+
+   
+
+    def get_row_count_estimates(self, AELO_dict, session=None):
+
+        '''return {(db, object): (estimated row count, 'estimated', None)} from collected statistics
+
+        statistics older than --stats_max_age days are ignored, so those objects are counted exactly'''
+
+        dbs = sorted({db for database_list in AELO_dict.values() for db in database_list})
+
+        if not dbs: return {}
+
+        db_list = ', '.join(f"'{db}'" for db in dbs)
+
+        query = (f"SELECT DatabaseName, TableName, MAX(RowCount) FROM DBC.StatsV WHERE DatabaseName IN ({db_list}) AND RowCount IS NOT NULL"
+
+                 f" AND LastCollectTimeStamp >= CURRENT_TIMESTAMP - INTERVAL '{self.args.stats_max_age}' DAY(4) GROUP BY 1, 2;")
+
+        results = (session or self.session).Teradata_query(query)
+
+        estimates = {}
+
+        if results is None:
+
+            print('WARNING: unable to read DBC.StatsV, counting all objects exactly')
+
+            return estimates
+
+        for result in results:
+
+            db, ob = result[0].strip().upper(), result[1].strip().upper()
+
+            if ob in AELO_dict and db in AELO_dict[ob]: estimates[(db, ob)] = (int(result[2]), 'estimated', None)
+
+        return estimates
+
+ 
+
+    def get_table_signatures(self, AELO_dict, session=None):
+
+        '''return {(db, table): [LastAlterTimeStamp, CurrentPerm]} for the tables (not views) in AELO_dict, in one catalog query
+
+        a load changes the signature of a table, see RowCountBaselines'''
+
+        dbs = sorted({db for database_list in AELO_dict.values() for db in database_list})
+
+        if not dbs: return {}
+
+        db_list = ', '.join(f"'{db}'" for db in dbs)
+
+        query = (f"SELECT t.DatabaseName, t.TableName, CAST(t.LastAlterTimeStamp AS VARCHAR(30)), s.CurrentPerm FROM DBC.TablesV t"
+
+                 f" LEFT JOIN (SELECT DatabaseName, TableName, SUM(CurrentPerm) AS CurrentPerm FROM DBC.TableSizeV WHERE DatabaseName IN ({db_list}) GROUP BY 1, 2) s"
+
+                 f" ON s.DatabaseName = t.DatabaseName AND s.TableName = t.TableName WHERE t.DatabaseName IN ({db_list}) AND t.TableKind IN ('T', 'O');")
+
+        results = (session or self.session).Teradata_query(query)
+
+        signatures = {}
+
+        if results is None:
+
+            print('WARNING: unable to read DBC.TablesV/DBC.TableSizeV, counting all objects')
+
+            return signatures
+
+        for result in results:
+
+            db, ob = result[0].strip().upper(), result[1].strip().upper()
+
+            if ob in AELO_dict and db in AELO_dict[ob]: signatures[(db, ob)] = [str(result[2]).strip(), None if result[3] is None else int(result[3])]
+
+        return signatures
+
+ 
+
+    def explain(self, query, session=None):
+
+        '''return (estimated seconds, estimated rows) of a query from its EXPLAIN, None for an estimate the EXPLAIN does not give
+
+        the EXPLAIN failing (no access, no such object, SQL not valid) raises its exception, see explain_failed()'''
+
+        if query not in self.explained:
+
+            self.explained[query] = explain_estimates('\n'.join(str(result[0]) for result in self.run_query('EXPLAIN ' + query, session)))
+
+        return self.explained[query]
+
+ 
+
+    def explain_failed(self, k, e):
+
+        '''print why the EXPLAIN of a query of object k failed and return it as the reason k is over the budget'''
+
+        reason = f"EXPLAIN failed: {' '.join(str(e).split()) or type(e).__name__}"
+
+        print(f'WARNING: {k}: {reason}')
+
+        return reason
+
+ 
+
+    def over_budget(self, seconds, rows):
+
+        '''return why a query with these estimates is over --cost_budget/--spool_budget, or None
+
+        a cost that is not known (the EXPLAIN was not understood) counts as over the budget'''
+
+        if self.args.cost_budget and seconds is None: return 'estimated time unknown'
+
+        if self.args.cost_budget and seconds > self.args.cost_budget:
+
+            return f'estimated {seconds:.0f}s > --cost_budget {self.args.cost_budget:g}s'
+
+        if self.args.spool_budget and rows is None: return 'estimated rows unknown'
+
+        if self.args.spool_budget and rows > self.args.spool_budget:
+
+            return f'estimated {rows} rows > --spool_budget {self.args.spool_budget}'
+
+        return None
+
+ 
+
+    def cost_gate(self, objects, queries_of, session=None):
+
+        '''--cost_budget/--spool_budget: EXPLAIN the queries queries_of(object) returns for every object, the ones about to run,
+
+        and return {object: reason} for the objects over the budget: the sum of the estimated times or the largest estimated rows
+
+        an object whose EXPLAIN failed is over the budget with the error as the reason'''
+
+        if not self.args.cost_budget and not self.args.spool_budget: return {}
+
+        costs, over = {}, {}
+
+        for k in objects:
+
+            try: estimates = [self.explain(query, session) for query in queries_of(k) if query]
+
+            except Exception as e:
+
+                costs[k], over[k] = (None, None), self.explain_failed(k, e)
+
+                continue
+
+            seconds, rows = [seconds for seconds, rows in estimates], [rows for seconds, rows in estimates]
+
+            costs[k] = (None if None in seconds else sum(seconds), None if None in rows else max(rows, default=0))
+
+            reason = self.over_budget(*costs[k])
+
+            if reason: over[k] = reason
+
+        self.cost_report(costs, over)
+
+        return over
+
+ 
+
+    def row_count_budget(self, AELO_dict, estimates, session=None):
+
+        '''cost gate of the row counts: return (over_budget, skipped) {object: reason} for the objects whose row count query is over the budget
+
+        and the ones not to count; with --over_budget sample, the statistics of the objects over the budget are added to estimates'''
+
+        over_budget, skipped = self.cost_gate(AELO_dict, lambda k: [self.row_count_query(k, list(enumerate(AELO_dict[k], 1)), estimates)], session), {}
+
+        if over_budget and self.args.over_budget == 'sample': #estimated cardinality from collected statistics instead of COUNT(*)
+
+            statistics = self.get_row_count_estimates({k: AELO_dict[k] for k in over_budget}, session)
+
+            estimates.update({key: value for key, value in statistics.items() if key not in estimates})
+
+        for k, reason in over_budget.items():
+
+            if self.args.over_budget == 'skip': skipped[k] = reason
+
+            elif self.args.over_budget == 'sample' and any((db, k) not in estimates for db in AELO_dict[k]): skipped[k] = f'{reason}, no fresh statistics'
+
+        return over_budget, skipped
+
+ 
+
+    def cost_report(self, costs, over):
+
+        '''print the estimated cost of the objects about to be queried, the 10 most expensive first'''
+
+        known = sorted(((seconds, rows, k) for k, (seconds, rows) in costs.items() if seconds is not None), key=lambda cost: cost[0], reverse=True)
+
+        unknown, failed = len(costs) - len(known), sum(reason.startswith('EXPLAIN failed') for reason in over.values())
+
+        print(f"\nCost report        : {len(costs)} objects, {sum(seconds for seconds, rows, k in known):.0f}s estimated in total"
+
+              f"{f', {unknown} not explained' if unknown else ''}{f' ({failed} EXPLAIN failed)' if failed else ''}, {len(over)} over the budget ({self.args.over_budget})")
+
+        for seconds, rows, k in known[:10]:
+
+            print(f"  {seconds:10.1f}s {'' if rows is None else rows:>15} rows  {k}{'  (over the budget)' if k in over else ''}")
+
+ 
+
+    def bundles(self, keys, query_of):
+
+        '''split keys into consecutive bundles whose queries add up to at most --bundle_size characters'''
+
+        bundle, size = [], 0
+
+        for key in keys:
+
+            if bundle and size + len(query_of(key)) > self.args.bundle_size:
+
+                yield bundle
+
+                bundle, size = [], 0
+
+            bundle.append(key)
+
+            size += len(query_of(key))
+
+        if bundle: yield bundle
+
+ 
+
+    def run_bundled(self, queries, session):
+
+        '''run queries of the same shape (UNION ALLs of SELECTs with the same column types, ending in ;) as one request
+
+        each SELECT gets a leading tag column, which is used to give every query its own results again
+
+        return {query: results}; queries that are not in it (bundle failed, or fewer than 2 queries) are run on their own'''
+
+        if len(queries) < 2: return {}
+
+        selects = []
+
+        for tag, query in enumerate(queries):
+
+            for select in query.rstrip(';').split(' UNION ALL '):
+
+                selects.append(f'SELECT CAST({tag} AS INTEGER) bundle_tag, ' + select[len('SELECT '):])
+
+        try: results = session.Teradata_query(' UNION ALL '.join(selects) + ';')
+
+        except Exception as e:
+
+            print(f'WARNING: bundle of {len(queries)} queries failed, running them one by one: {e}')
+
+            return {}
+
+        if results is None: return {}
+
+        bundled = {query: [] for query in queries}
+
+        for result in results:
+
+            bundled[queries[int(result[0])]].append(tuple(result[1:]))
+
+        return bundled
+
+ 
+
+    def row_count_query(self, k, numbered_items, estimates):
+
+        '''return the query that counts the rows of table/view k in each (number, database) of numbered_items not in estimates, or '' '''
+
+        alias, end_line = self.row_count_alias, ' UNION ALL '
+
+        exact_items = [(n, item) for n, item in numbered_items if (item, k) not in estimates]
+
+        query = ''
+
+        count = 0
+
+        for n, item in exact_items:
+
+            count += 1
+
+            if count == len(exact_items): end_line = ';'
+
+            query += f"SELECT {n}{alias[0]}, CAST('{item}.{k}' AS VARCHAR(100)){alias[1]}, CAST(COUNT(*) AS BIGINT){alias[2]}, CAST('exact' AS VARCHAR(9)){alias[3]} FROM {item}.{k}%s" % end_line
+
+        return query
 
  
 
-    def ask(self, question):
+    def count_rows(self, k, numbered_items, estimates, session, bundled=None):
 
-        '''ask a question and return the answer'''
+        '''count the rows of table/view k in each (number, database) of numbered_items
 
-        return input(f'{question} ')
+        counts in estimates {(db, object): (count, 'estimated'|'carried', counted at)} are taken from there instead
 
- 
+        results of a query already run by run_bundled are taken from bundled; return (query text, result rows)'''
 
-    def ask_YNQ(self, question, default_enter):
+        query, text = self.row_count_query(k, numbered_items, estimates), ''
 
-        '''ask a YES/NO/QUIT question'''
+        results = []
 
-        default = ''
+        if query:
 
-        if default_enter != '': default = f'[ENTER = {default_enter.upper()}] '
+            text += query.replace('SELECT ', '\nSELECT ')+'\n'
 
-        while True:
+            if bundled and query in bundled: results = bundled[query]
 
-            result = input(f'{question} (Y/N/Q) {default}? ')
+            else: results = self.run_query(query, session)
 
-            result = result.strip().upper()
+        known = [(n, f'{item}.{k}') + estimates[(item, k)] for n, item in numbered_items if (item, k) in estimates]
 
-            if result == '':
+        if known:
 
-                if default_enter != '': result = default_enter.strip().upper()
+            estimated = [name for n, name, count, method, counted_at in known if method == 'estimated']
 
-            if result == 'Y': return True
+            carried = [f'{name} ({counted_at})' for n, name, count, method, counted_at in known if method == 'carried']
 
-            if result == 'N': return False
+            if estimated: text += f"\n--estimated from DBC.StatsV: {', '.join(estimated)}\n"
 
-            if result == 'Q':
+            if carried: text += (f"\n--carried forward, not deployed by the release and unchanged since counted: {', '.join(carried)}"
 
-                print('\nScript terminated.')
+                                 "\n--(unchanged: same LastAlterTimeStamp and CurrentPerm; a load that changes neither is not detected, use --recount_all)\n")
 
-                os._exit(0)
+            results = sorted([list(result) for result in results] + [[n, name, count, method] for n, name, count, method, counted_at in known], key=lambda row: row[0])
+
+        return text, results
 
  
 
-    def svn_directory_and_file_lists(self, checkout_target_dir):
+    def row_count_estimates(self, AELO_dict, baselines, deployed):
 
-        '''get list of dirs and files from target dir'''
+        '''return (estimates, signatures) for the objects in AELO_dict: {(db, object): (count, 'estimated'|'carried', counted at)} for count_rows,
 
-        def read(directory, dir_list, file_list):
+        from statistics (--row_count_mode estimate) and from baselines, and the table signatures to keep with the exact counts
 
-            '''recursive function: read dirs and files in a directory'''
+        tables in the release's deploy set deployed (see deployed_objects()) are always counted: a load need not change their signature'''
 
-            for item in directory.iterdir():
+        estimates = {}
 
-                #ignore these directories
+        if self.args.row_count_mode == 'estimate': estimates = self.get_row_count_estimates(AELO_dict)
 
-                if str(item).endswith('.svn'): continue
+        signatures = self.get_table_signatures(AELO_dict)
 
-                if str(item).endswith('Rollback'): continue
+        if not self.args.recount_all and deployed is not None:
 
-                if str(item).endswith('Test Approach'): continue
+            for (db, ob), signature in signatures.items():
 
-                if str(item).endswith('Test Evidence'): continue
+                if (db, ob) in deployed: continue
 
-                if str(item).endswith('Test Plan'): continue
+                baseline = baselines.carried(db, ob, signature)
 
-                if str(item).endswith('Test Report'): continue
+                if baseline is not None and (db, ob) not in estimates: estimates[(db, ob)] = (baseline['count'], 'carried', baseline['counted_at'])
 
-                if str(item).endswith('Test Scripts'): continue
+        return estimates, signatures
 
-                #add files and directories to lists
+ 
 
-                if item.is_file(): file_list.append(item)
+    def keep_baselines(self, k, items, rows, signatures, baselines):
 
-                if item.is_dir():
+        '''keep the exact counts in the row count result rows of table/view k as baselines'''
 
-                    dir_list.append(item)
+        for row in rows:
 
-                    read(item, dir_list, file_list)
+            db = items[int(row[0])-1]
 
-            return dir_list, file_list
+            if str(row[3]).strip() == 'exact' and (db, k) in signatures: baselines.put(db, k, row[2], signatures[(db, k)])
 
-       
+ 
 
-        dir_list, file_list = read(pathlib.Path(str(checkout_target_dir)), [], [])
+    def count_object_rows(self, k, numbered_items, estimates, skipped, session, bundled=None):
 
-        if not dir_list: dir_list.append(checkout_target_dir)
+        '''count the rows of table/view k in each (number, database) of numbered_items with count_rows, unless k is in skipped {object: reason}
 
-        return sorted(dir_list), sorted(file_list)
+        return ([(query text, result rows)], error)'''
 
- 
+        try:
 
-    def get_AELO_dict(self, filelist):
+            if k in skipped: return [(f'\n--skipped, {skipped[k]}\n', [])], None
 
-        '''get dictionary of all database.[table|view]s in release
+            return [self.count_rows(k, numbered_items, estimates, session, bundled)], None
 
-        "[table|view]name":["db1", "db2", "db3", "db4", "db5"]'''
+        except Exception as e:
 
-        summary_text = ['CREATE TABLE','CREATE MULTISET TABLE','CREATE SET TABLE','REPLACE VIEW','RENAME VIEW']
+            print(f'ERROR: row count of {k} failed: {e}')
 
-        AELO_dict = {} #key = database, value = table or view
+            return [(f'\n--ERROR: row count of {k} failed: {e}\n', [])], str(e)
 
-        for filename in filelist:
+ 
 
-            if filename.name == 'deploy_items.tmp': continue #might be unlinked (deleted)
+    def row_count_evidence(self, k, counts):
 
-            if filename.suffix.lower() not in ['.ddl','.sql']: continue
+        '''combine [(query text, result rows), ...] from count_rows into the evidence for table/view k'''
 
-            #print(filename.name)
+        if len(counts) == 1: text, results = counts[0]
 
-            #file = open(filename, "r", encoding="utf-8")
+        else: text, results = ''.join(count[0] for count in counts), sorted([list(row) for count in counts for row in count[1] or []], key=lambda row: row[0])
 
-            file = open(filename, "r")
+        return [text, (k, self.row_count_alias, results)]
 
-            if filename.stat().st_size == 0: continue #firstlines.append('(empty file)')
+ 
 
-           
+    def create_query_row_counts(self, filelist, query_filename):
 
-            for line in file:
+        '''generate and run queries to count rows
 
-                append_line = line.upper().strip()
+        with --row_count_mode estimate, objects with fresh statistics report the estimated cardinality instead of COUNT(*)
 
-                if append_line.startswith('--'): continue
+        tables outside the release's deploy set that have not changed since they were last counted report that count (method "carried"), unless --recount_all'''
 
-                for summary in summary_text:
+        print('Row count queries  : ', end='')
 
-                    if append_line.find(summary) is not -1:
+        AELO_dict = self.get_AELO_dict(filelist, self.args.skip_trivial_views)
 
-                        append_line = append_line.lstrip(summary)
+        checkpoint = Checkpoint(query_filename, self.args.resume)
 
-                        if summary == 'RENAME VIEW':
+        AELO_dict = {k: items for k, items in AELO_dict.items() if not checkpoint.done(k)}
 
-                            m = re.compile('(?<=TO).*(?=;)', re.IGNORECASE).search(append_line)
+        baselines = RowCountBaselines(query_filename)
 
-                            #m = re.compile('(?<=TO).*(?=[ ;])', re.IGNORECASE).search(append_line)
+        estimates, signatures = self.row_count_estimates(AELO_dict, baselines, self.deployed_objects())
 
-                            if m is not None:
+        over_budget, skipped = self.row_count_budget(AELO_dict, estimates)
 
-                                append_line = m.group().strip().rstrip(';').rstrip()
+        if self.args.over_budget == 'defer': AELO_dict = dict(sorted(AELO_dict.items(), key=lambda item: item[0] in over_budget)) #over the budget last
 
-                            else:
+        AELO_query = checkpoint.open_evidence()
 
-                                print(f'There is some kind of issue (A) parsing this line that should be investigated: {append_line}')
+        exporter = checkpoint.exporter(self.args.parquet)
 
-                        else:
+        row_counts = {} #k: result rows, for the environment matrix
 
-                            #append_line = append_line.lstrip().split(' ')[0].replace('"','').replace(',','').replace('NO FALLBACK','').replace('FALLBACK','')
+        queries = {k: '' if k in skipped else self.row_count_query(k, list(enumerate(items, 1)), estimates) for k, items in AELO_dict.items()}
 
-                            append_line = append_line.lstrip().replace('"','').replace(',','').replace('NO FALLBACK','').replace('FALLBACK','').rstrip()
+        for bundle in self.bundles(AELO_dict, queries.get): #one request per bundle of objects
 
-                            if ' AS ' in append_line.upper():
+            bundled = self.run_bundled([queries[k] for k in bundle if queries[k]], self.session)
 
-                                as_index = append_line.upper().index(" AS ")
+            for k in bundle:
 
-                                append_line = f'{append_line[:as_index].strip()}'
+                items = AELO_dict[k]
 
-                            if append_line.endswith('_N') or append_line.endswith('_O'): continue
+                counts, error = self.count_object_rows(k, list(enumerate(items, 1)), estimates, skipped, self.session, bundled)
 
-                        if '.' in append_line:
+                self.write_evidence(AELO_query, exporter, self.row_count_evidence(k, counts))
 
-                            db, ob = append_line.split('.')[0].replace('$$ENV$$', self.ini['environment']), append_line.split('.')[1]
+                checkpoint.record(k, AELO_query, exporter, error)
 
-                            if ob not in AELO_dict: AELO_dict[ob] = []
+                row_counts[k] = [row for count in counts for row in count[1] or []]
 
-                            if db not in AELO_dict[ob]: AELO_dict[ob].append(db)#;print(ob,db)
+                self.keep_baselines(k, items, row_counts[k], signatures, baselines)
 
-                            break
+        AELO_query.close()
 
-                        else:
+        exporter.close()
 
-                            print(f'ERROR: Cannot read database.object in {filename.name} from string: {append_line}')
+        baselines.save()
 
-                            break
+        methods = collections.Counter(method for count, method, counted_at in estimates.values())
 
-            file.close()
+        if methods: print(f"({', '.join(f'{n} {method}' for method, n in sorted(methods.items()))}) ", end='')
 
-        #for k,v in AELO_dict.items(): print(k,v)
+        if skipped: print(f'({len(skipped)} over the budget skipped) ', end='')
 
-        #exit()
+        if checkpoint.failed: print(f'({checkpoint.failed} failed, rerun with --resume to retry) ', end='')
 
-        return AELO_dict
+        print(query_filename)
 
-       
+        return row_counts
 
-    def create_query_data_checks(self, filelist, query_filename):
+ 
 
-        '''generate AELO queries to be run post-load for ODS releases 2
+    def run_post_load_pipeline(self, filelist, query_row_counts_filename, query_data_checks_filename):
 
-        use the -z switch to run this'''
+        '''-z with --pipeline: parse the release, count rows and check data at the same time on --workers sessions
 
-        print('Data check queries : ', end='')
+        the main thread parses one file at a time while the sessions run queries; the databases it finds are counted in batches of
 
-       
+        --queue_size (their estimates, signatures and cost gate are read per batch), and as any file may add a database to an object, the data
 
-        def find_values_in_all_tables(tablename, dbnames):
+        checks are queued once every file is parsed, each one after the row counts of its object; at most --queue_size tasks wait
 
-            '''find a value in a column common to all tables, return that value or None'''
+        objects are counted and checked by the same code as in create_query_row_counts and create_query_data_checks (an object
 
-            num_values_to_check = 50000
+        found in more than one batch gets one row count query per batch); the main thread writes the evidence and checkpoint
 
-            find_common_value = []
+        entry of each object, with what the workers printed for it, as soon as it and the objects before it are finished'''
 
-            max_values_to_find = 20
+        print('Pipeline           : ', end='')
 
-            for db in dbnames:
+        start = time.time()
 
-                if first_key is None: continue
+        skip = self.trivial_views(filelist) if self.args.skip_trivial_views else set() #needs the dependencies of the whole release
 
-                query = f"SEL TOP {num_values_to_check} {first_key} FROM {db}.{tablename} ORDER BY 1 ASC;"
+        if skip: print(f'({len(skip)} trivial views skipped) ', end='')
 
-                results = self.session.Teradata_query(query)
+        row_count_checkpoint = Checkpoint(query_row_counts_filename, self.args.resume)
 
-                clean_results = []
+        data_check_checkpoint = Checkpoint(query_data_checks_filename, self.args.resume)
 
-                for result in results:
+        baselines = RowCountBaselines(query_row_counts_filename)
 
-                    clean_results.append(result[0].strip(' '))
+        deployed = self.deployed_objects() if baselines.baselines and not self.args.recount_all else None #only needed to carry baselines
 
-                find_common_value.append(clean_results)
+        files, found = collections.deque(filelist), [] #found: (object, number, database) not queued yet
 
-                print(query+' --'+str(len(clean_results))+' rows returned')
+        AELO_dict, position, signatures, task_args = {}, {}, {}, {} #task_args: task: (estimates, skipped) or (over_budget,)
 
-            found_values = []
+        row_count_tasks, deferred_objects = collections.defaultdict(list), set() #object: its row count tasks
 
-            if find_common_value[0] == []:
+        pending, sequence = [], itertools.count() #heap of (object position, 0 row count|1 data check, sequence, task)
 
-                print('return (1)')
+        deferred, data_check_deferred = [], [] #--over_budget defer: run after every other task
 
-                return []
+        objects, row_count_order, data_check_order, gated = None, None, collections.deque(), 0
 
-            for value in find_common_value[0]:
+        tasks, finished = queue.Queue(), queue.Queue()
 
-                for i in range(1, len(find_common_value)):
+        results, printed, output = {}, {}, ThreadOutput(sys.stdout)
 
-                    if value not in find_common_value[i]:
+        sessions = self.worker_sessions(self.args.workers)
 
-                        break
+       
 
-                    else:
+        def work(session):
 
-                        if value not in found_values:
+            '''run row count and data check tasks until a None task arrives, keeping what they print for the main thread'''
 
-                            found_values.append(value)
+            while True:
 
-                if len(found_values) == max_values_to_find:
+                task = tasks.get()
 
-                    print('return (2)')
+                if task is None: return
 
-                    return found_values
+                buffer = output.capture()
 
-            print('return (3)')
+                try:
 
-            return found_values
+                    if task[0] == 'row count': result = self.count_object_rows(task[1], list(task[2]), *task_args[task], session)
 
-       
+                    else: result = self.check_object_data(task[1], AELO_dict[task[1]], *task_args[task], session)
 
-        AELO_dict = self.get_AELO_dict(filelist) #key:value = "[table|view]name":["db1", "db2", "db3", "db4", "db5"]
+                finally: output.release()
 
-        #for tablename, dbnames in AELO_dict.items(): print(f'-->{tablename}|{dbnames}')
+                printed[task] = buffer.getvalue()
+
+                results[task] = result
 
-        AELO_query = open(query_filename, "w", encoding="utf-8")
+                finished.put(task)
 
-      
+       
 
-        column_query = "SEL CAST(columnname AS VARCHAR(100)) FROM dbc.COLUMNS WHERE databasename='%s' AND TABLENAME='%s' AND columnname NOT IN ('start_date','end_date','start_ts','end_ts','record_deleted_flag','ctl_id','process_name','process_id','update_process_name','update_process_id') ORDER BY columnid;"
+        def parse_next_file():
 
-        counter = 0
+            '''add the tables/views of the next file to AELO_dict, in the order of get_AELO_dict()'''
 
-        for tablename, dbnames in AELO_dict.items():
+            for ob, db in self.iter_AELO([files.popleft()], skip):
 
-            counter += 1
+                if ob not in AELO_dict: AELO_dict[ob], position[ob] = [], len(position)
 
-            column_list, columns, first_key = ['name'], {}, None
+                if db in AELO_dict[ob]: continue
 
-           
+                AELO_dict[ob].append(db)
 
-            #GET PRIMARY KEY
+                if not row_count_checkpoint.done(ob): found.append((ob, len(AELO_dict[ob]), db))
 
-            query= f"SELECT COALESCE(Key_Column, '') FROM DW{self.ini['environment']}V_GCFR.GCFR_Transform_KeyCol WHERE Out_DB_Name = 'DW{self.ini['environment']}V_ODS_IN' AND Out_Object_Name = '{tablename}';"
+       
 
-            primary_key_list = self.session.Teradata_query(query)
+        def queue_row_counts():
 
-            primary_key = []
+            '''read the estimates and signatures of the databases found since the last batch, gate their row counts and queue them'''
 
-            for item in primary_key_list:
+            batch = collections.defaultdict(list)
 
-                primary_key.append(item[0])
+            for ob, n, db in found: batch[ob].append((n, db))
 
-            first_key = primary_key[0]
+            found.clear()
 
-           
+            items = {ob: [db for n, db in numbered_items] for ob, numbered_items in batch.items()}
 
-            for db in dbnames:
+            estimates, batch_signatures = self.row_count_estimates(items, baselines, deployed)
 
-                #print(f'-->{tablename}|{db}')
+            signatures.update(batch_signatures)
 
-                query = column_query % (db, tablename)
+            over_budget, skipped = self.row_count_budget(items, estimates)
 
-                results = self.session.Teradata_query(query)
+            for ob, numbered_items in batch.items():
 
-                for result in results:
+                task = ('row count', ob, tuple(numbered_items))
 
-                    key = result[0].strip(' ')
+                task_args[task] = ({(db, ob): estimates[(db, ob)] for n, db in numbered_items if (db, ob) in estimates}, {ob: skipped[ob]} if ob in skipped else {})
 
-                    if key is None: continue
+                row_count_tasks[ob].append(task)
 
-                    if not first_key: first_key = key
+                if ob in over_budget and self.args.over_budget == 'defer':
 
-                    #print(first_key)
+                    deferred.append(task)
 
-                    if key not in columns:
+                    deferred_objects.add(ob)
 
-                        column_list.append(key)
+                else: heapq.heappush(pending, (position[ob], 0, next(sequence), task))
 
-                        columns[key] = 0
+       
 
-                    columns[key] += 1
+        def queue_data_checks():
 
-                    #print(f'columns[{key}]={columns[key]}')
+            '''gate the data checks of the next --queue_size objects and queue each one after the row counts of its object'''
 
-           
+            nonlocal gated
 
-            #delete columns that are not in every db
+            batch = [tablename for tablename in objects[gated:gated+self.args.queue_size] if not data_check_checkpoint.done(tablename)]
 
-            delete_columns = []
+            gated += self.args.queue_size
 
-            for column_name, num in columns.items():
+            over_budget = self.cost_gate(batch, lambda tablename: self.data_check_queries(tablename, AELO_dict[tablename])) if batch else {}
 
-                if num < len(dbnames): #column name is common to every identically named table/view in every database, so we can query it
+            for tablename in batch:
 
-                    if column_name not in delete_columns:
+                task_args[('data check', tablename)] = ({tablename: over_budget[tablename]} if tablename in over_budget else {},)
 
-                        delete_columns.append(column_name)
+                if tablename in over_budget and self.args.over_budget == 'defer': data_check_deferred.append(tablename)
 
-                if len(column_name) > 29:
+                else:
 
-                    #returned column names have a max length of 30 (for some unknown reason...)
+                    heapq.heappush(pending, (position[tablename], 1, next(sequence), ('data check', tablename)))
 
-                    #therefore, any column name that is 30 characters long MAY be truncated, so, as a precaution, remove it
+                    data_check_order.append(tablename)
 
-                    if column_name not in delete_columns:
+       
 
-                        delete_columns.append(column_name)
+        def write_finished():
 
-            for column_name in delete_columns:
+            '''write the evidence of the objects whose tasks have finished, in order'''
 
-                del columns[column_name]
+            while row_count_order and all(task in results for task in row_count_tasks[row_count_order[0]]):
 
-                column_list.remove(column_name)
+                k, counts, error = row_count_order.popleft(), [], None
 
-           
+                for task in row_count_tasks[k]:
 
-            found_values = find_values_in_all_tables(tablename, dbnames)
+                    print(printed.pop(task), end='')
 
-            if found_values == []:
+                    task_counts, task_error = results.pop(task)
 
-                print(f'{counter:03}/{len(AELO_dict):03}:{tablename} has no data')
+                    counts, error = counts + task_counts, error or task_error
 
-            else:
+                self.write_evidence(row_count_file, row_count_exporter, self.row_count_evidence(k, counts))
 
-                for found_value in found_values:
+                row_count_checkpoint.record(k, row_count_file, row_count_exporter, error)
 
-                    cast, query, end_line = "Cast(\"%s\" AS VARCHAR(50))", "", ' UNION ALL '
+                self.keep_baselines(k, AELO_dict[k], [row for count in counts for row in count[1] or []], signatures, baselines)
 
-                    count = 0
+            while data_check_order and ('data check', data_check_order[0]) in results:
 
-                    for db in dbnames:
+                tablename = data_check_order.popleft()
 
-                        count += 1
+                print(printed.pop(('data check', tablename)), end='')
 
-                        dbobject = f"'{db}.{tablename}'"
+                evidence, status, error = results.pop(('data check', tablename))
 
-                        query += f"SELECT Cast({dbobject} AS VARCHAR(50))"
+                self.write_evidence(data_check_file, data_check_exporter, evidence)
 
-                        for column in columns:
+                data_check_checkpoint.record(tablename, data_check_file, data_check_exporter, error)
 
-                            query += f", {cast % column}"
+                if status: print(f'{position[tablename]+1:03}/{len(AELO_dict):03}:{tablename} {status}')
 
-                        if found_value == 'None':
+       
 
-                            query += f" FROM {db}.{tablename} WHERE {first_key} IS NULL"
+        threads = [threading.Thread(target=work, args=(session,), daemon=True) for session in sessions]
 
-                        else:
+        for thread in threads: thread.start()
 
-                            query += f" FROM {db}.{tablename} WHERE {first_key} = '{found_value}'"
+        row_count_file, row_count_exporter = row_count_checkpoint.open_evidence(), row_count_checkpoint.exporter(self.args.parquet)
 
-                        if count == len(dbnames): end_line = ';'
+        data_check_file, data_check_exporter = data_check_checkpoint.open_evidence("utf-8"), data_check_checkpoint.exporter(self.args.parquet)
 
-                        query += end_line
+        queued = 0
 
-                    AELO_query.write(query.replace('SELECT ', '\nSELECT ')+'\n')     #write query to file
+        with contextlib.redirect_stdout(output):
 
-                    results = self.session.Teradata_query(query)                     #run query
+            while True:
 
-                    AELO_query.write('/*\n'+teradata_funcs.teradata_funcs.format_results(column_list, results)+'*/\n')
+                if found and (not files or len(found) >= self.args.queue_size): queue_row_counts()
 
-            #if counter == 2: exit()
+                if not files and objects is None: #every file is parsed: the database lists are complete
 
-       
+                    objects = list(AELO_dict)
 
-        AELO_query.close()
+                    row_count_order = collections.deque([k for k in objects if k in row_count_tasks and k not in deferred_objects] + [k for k in objects if k in deferred_objects])
 
-        print(query_filename)
+                while objects is not None and gated < len(objects) and (not pending or pending[0][0] >= gated): queue_data_checks()
 
-   
+                if objects is not None and gated >= len(objects) and (deferred or data_check_deferred): #over the budget last
 
-    def create_query_row_counts(self, filelist, query_filename):
+                    for task in deferred: heapq.heappush(pending, (len(objects), 0, next(sequence), task))
 
-        '''generate and run queries to count rows'''
+                    for tablename in data_check_deferred: heapq.heappush(pending, (len(objects), 1, next(sequence), ('data check', tablename)))
 
-        print('Row count queries  : ', end='')
+                    data_check_order.extend(data_check_deferred)
 
-        AELO_dict = self.get_AELO_dict(filelist)
+                    deferred.clear(); data_check_deferred.clear()
 
-        AELO_query = open(query_filename, "w")
+                while pending and queued < self.args.queue_size:
 
-        items = []
+                    tasks.put(heapq.heappop(pending)[-1])
 
-        for k, v in AELO_dict.items():
+                    queued += 1
 
-            query = ''
+                if files: parse_next_file() #while the sessions run the queued tasks
 
-            items = AELO_dict[k]
+                elif queued:
 
- 
+                    finished.get()
 
-            alias, end_line = [' #', ' name', ' total'], ' UNION '
+                    queued -= 1
 
-            count = 0
+                else: break
 
-            for item in items:
+                while not finished.empty():
 
-                count += 1
+                    finished.get()
 
-                if count == 2: alias1, alias2, alias3 = ('',)*3
+                    queued -= 1
 
-                if count == len(items): end_line = ';'
+                write_finished()
 
-                query += f"SELECT {count}{alias[0]}, CAST('{item}.{k}' AS VARCHAR(100)){alias[1]}, CAST(COUNT(*) AS BIGINT){alias[2]} FROM {item}.{k}%s" % end_line
+        for thread in threads: tasks.put(None)
 
-                if count == len(items):
+        for thread in threads: thread.join()
 
-                    AELO_query.write(query.replace('SELECT ', '\nSELECT ')+'\n')     #write query to file
+        for evidence_file in (row_count_file, row_count_exporter, data_check_file, data_check_exporter): evidence_file.close()
 
-                    results = self.session.Teradata_query(query)                     #run query
+        baselines.save()
 
-                    AELO_query.write('/*\n'+teradata_funcs.teradata_funcs.format_results(alias, results)+'*/\n')
+        print(f'{len(AELO_dict)} objects on {len(sessions)} sessions in {time.time()-start:.0f}s')
 
-        AELO_query.close()
+        print(f'Row count queries  : {query_row_counts_filename}')
 
-        print(query_filename)
+        print(f'Data check queries : {query_data_checks_filename}')
+
+        failed = row_count_checkpoint.failed + data_check_checkpoint.failed
+
+        if failed: print(f'{failed} row counts/data checks failed, rerun with --resume to retry')
 
    
 
@@ -1144,9 +4392,69 @@ class DWHTestInit:
 
     def synopsize(self, filelist, synopsis_filename, multi_svn_id):
 
-        '''make synopsis file showing first line in each ddl/sql file'''
+        '''make synopsis file showing first line in each ddl/sql file, add the redeploy init deletes'''
 
-        summary_text = ['COLLECT STATISTICS','COLLECT STATS','ALTER TABLE','CREATE TABLE','CREATE MULTISET TABLE','CREATE SET TABLE','RENAME TABLE','REPLACE VIEW','CREATE VIEW','REPLACE RECURSIVE VIEW','RENAME VIEW','EXEC','INSERT INTO','DROP TABLE','DROP VIEW','DELETE','UPDATE','SELECT']
+        self.write_synopsis(filelist, synopsis_filename)
+
+        redeploy_init = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_redeploy_init{multi_svn_id}.sql")
+
+        redeploy_init.touch()
+
+        #write to redeploy_init
+
+        today = datetime.date.today().strftime('%Y-%m-%d')
+
+        delete = []
+
+        delete.append(f"/*")
+
+        delete.append(f"DELETE FROM DW{self.ini['environment']}T_GCFR.GCFR_SSIS_File WHERE Ctl_Id = 123 AND File_Id IN (1,2,3);")
+
+        delete.append(f"DELETE FROM DW{self.ini['environment']}T_GCFR.SSIS_File_Config WHERE TableType LIKE 'SOMETHING%';")
+
+        delete.append(f"DELETE FROM DW{self.ini['environment']}T_GCFR.GCFR_System_File_Extract WHERE Ctl_Id = 123  AND File_Id IN (1,2,3) AND Business_Date IN (DATE '{today}', DATE '{today}');")
+
+        add_lines = True
+
+       
+
+        #file = open(redeploy_init, "r")
+
+        #for line in file:
+
+        #    if delete[0] == line.strip():
+
+        #        add_lines = False
+
+        #        break
+
+        with open(redeploy_init, "a+") as file:
+
+            for line in file:
+
+                if delete[0] == line.strip():
+
+                    add_lines = False
+
+                    file.write(f"--should exist\n\n--should not exist\n\n--?\n\n")
+
+                    break
+
+       
+
+        if add_lines:
+
+            with open(redeploy_init, 'a+') as file:
+
+                for line in delete:
+
+                    file.write('\n'+line)
+
+ 
+
+    def write_synopsis(self, filelist, synopsis_filename):
+
+        '''write the synopsis file: the first line of each ddl/sql file'''
 
         firstlines = []
 
@@ -1154,157 +4462,209 @@ class DWHTestInit:
 
         synopsis = open(synopsis_filename, "w")
 
-        for filename in filelist:
+        self.parse_files(filelist, 'synopsis', synopsis_line)
 
-            isSummarized = False
+        for filename in filelist:
 
-            file = open(filename, "r")
+            kind, append_line, num_semicolons = self.parsed(filename, 'synopsis', synopsis_line)
 
-            if filename.stat().st_size == 0:
+            if kind == 'empty':
 
                 firstlines.append('(empty file)')
 
-                file.close()
-
                 continue
 
-           
+            if kind is None: continue
 
-            #count no. of statements (= no. of semicolons)
+            if kind == 'truncate': append_line = append_line[:maxlen].strip()
 
-            num_semicolons = 0
+            if num_semicolons > 1:
 
-            for line in file:
+                append_line += f' (+{num_semicolons-1} more)'
 
-                if line.strip().startswith('--'): continue
+            firstlines.append(append_line)
 
-                if line.strip().startswith('/*'): continue
+            if len(append_line) > maxlen: maxlen = len(append_line)
 
-                num_semicolons += line.count(';')
+       
 
-            file.close()
+        if len(firstlines) > 0: maxlen = len(max(firstlines, key=len))
 
-           
+        for line, filename in zip(firstlines, filelist):
 
-            file = open(filename, "r")
+            #synopsis.write(line+(' '*(maxlen-len(line)+1))+str(filename)+'\n')
 
-            block_comment_mode = False
+            synopsis.write(line+(' '*(maxlen-len(line)+1))+self.files.teradata_relative(filename)+'\n')
 
-            for line in file:
+        synopsis.close()
 
-                while '  ' in line:
+ 
 
-                    line = line.replace('  ',' ')
+    def read_release(self, checkout_target_dir, multi_svn_id):
 
-                if isSummarized: break
+        '''list the files of a checked out release, find its TERADATA folder and compare the files with the manifest of the last run
 
-                append_line = line.strip()
+        return True if no file was added, changed or deleted since the last run'''
 
-                if append_line.startswith('--'): continue
+        self.dir_list, self.file_list = self.svn_directory_and_file_lists(checkout_target_dir)
 
-                if append_line.startswith('/*'): block_comment_mode = True
+        self.teradata_path, self.teradata_parent_path = self.get_teradata_paths(self.dir_list)
 
-                if block_comment_mode:
+        self.files = FileIndex(self.file_list, self.teradata_path, self.teradata_parent_path)
 
-                    if '*/' in line:
+        manifest_filename = pathlib.Path(self.ini['work_folder']) / f".{self.ini['dwh']}_manifest{multi_svn_id}.json"
 
-                        line = f'{line[line.index("*/")+2:].strip()}'
+        last = None if self.resident is None else self.resident.manifests.get(str(manifest_filename))
 
-                        block_comment_mode = False
+        self.manifest = ReleaseManifest(manifest_filename, checkout_target_dir, self.args.full, last)
 
-                    else:
+        if self.resident is not None: self.resident.manifests[str(manifest_filename)] = self.manifest
 
-                        continue
+        return self.manifest.update(self.files)
+
+ 
 
-                for summary in summary_text:
+    def refresh_release(self, checkout_target_dir, multi_svn_id):
 
-                    if line.upper().find(summary) is not -1:
+        '''--watch: regenerate deploy_items.txt, the synopsis, the dependency graph and the database check of a release
 
-                        if summary in ['COLLECT STATISTICS','COLLECT STATS','EXEC','INSERT INTO','DELETE','UPDATE','SELECT']:
+        the manifest of the last refresh is reused, so only changed files are parsed again'''
 
-                            append_line = line[:maxlen].strip()
+        print(f"\n{datetime.datetime.now():%H:%M:%S} Change in {checkout_target_dir}")
 
-                        if num_semicolons > 1:
+        self.args.full = False
 
-                            append_line += f' (+{num_semicolons-1} more)'
+        if self.read_release(checkout_target_dir, multi_svn_id):
 
-                        firstlines.append(append_line)
+            print('No files added, changed or deleted')
 
-                        if len(append_line) > maxlen: maxlen = len(append_line)
+            return
 
-                        isSummarized = True
+        if self.teradata_path is None or self.teradata_parent_path is None: return
 
-                        break
+        self.deploy_items_path, self.synopsis_list = self.validate_create_deploy_items(multi_svn_id)
 
-            file.close()
+        self.manifest.artifacts.update({'teradata_path': str(self.teradata_path), 'deploy_items_path': str(self.deploy_items_path),
+
+                                        'synopsis_list': None if self.synopsis_list is None else [str(f) for f in self.synopsis_list]})
+
+        if self.synopsis_list is not None:
+
+            synopsis_file = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_synopsis{multi_svn_id}.txt")
+
+            self.write_synopsis(self.synopsis_list, synopsis_file)
+
+            print(f'Synopsis           : {synopsis_file}')
+
+            dependency_graph_file = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_dependencies{multi_svn_id}.csv")
+
+            self.write_dependency_graph(self.synopsis_list, dependency_graph_file)
+
+            self.check_databases_exist()
+
+        self.manifest.save()
+
+        self.metadata_cache.save()
+
+        self.stage_phase_done()
+
+ 
+
+    def watch(self, targets):
+
+        '''--watch: refresh_release() each (checkout_target_dir, teradata_path, multi_svn_id) target when files in its TERADATA folder change
+
+        a change is picked up once nothing has changed for --watch_debounce seconds; uses filesystem notifications
+
+        if watchdog is installed, otherwise polls every --watch_interval seconds. Ctrl+C stops watching'''
+
+        changed_at = {} #checkout_target_dir: time of the last change that has not been refreshed yet
 
        
 
-        if len(firstlines) > 0: maxlen = len(max(firstlines, key=len))
+        def snapshot(folder):
 
-        for line, filename in zip(firstlines, filelist):
+            '''return {filename: (size, mtime)} for every file under folder'''
 
-            #synopsis.write(line+(' '*(maxlen-len(line)+1))+str(filename)+'\n')
+            files = {}
 
-            synopsis.write(line+(' '*(maxlen-len(line)+1))+str(filename).replace(str(self.teradata_path), '')+'\n')
+            for dir_name, subdirs, filenames in os.walk(folder):
 
-        synopsis.close()
+                for filename in filenames:
+
+                    try: stat = os.stat(os.path.join(dir_name, filename))
+
+                    except OSError: continue #deleted while walking
+
+                    files[os.path.join(dir_name, filename)] = (stat.st_size, stat.st_mtime)
+
+            return files
 
        
 
-        redeploy_init = pathlib.Path(self.ini['work_folder']) / pathlib.Path(f"{self.ini['dwh']}_redeploy_init{multi_svn_id}.sql")
+        observer, snapshots = None, {}
 
-        redeploy_init.touch()
+        if watchdog is not None:
 
-        #write to redeploy_init
+            class ChangeHandler(watchdog.events.FileSystemEventHandler):
 
-        today = datetime.date.today().strftime('%Y-%m-%d')
+                def __init__(self, target):
 
-        delete = []
+                    self.target = target
 
-        delete.append(f"/*")
+                def on_any_event(self, event):
 
-        delete.append(f"DELETE FROM DW{self.ini['environment']}T_GCFR.GCFR_SSIS_File WHERE Ctl_Id = 123 AND File_Id IN (1,2,3);")
+                    changed_at[self.target] = time.time()
 
-        delete.append(f"DELETE FROM DW{self.ini['environment']}T_GCFR.SSIS_File_Config WHERE TableType LIKE 'SOMETHING%';")
+            observer = watchdog.observers.Observer()
 
-        delete.append(f"DELETE FROM DW{self.ini['environment']}T_GCFR.GCFR_System_File_Extract WHERE Ctl_Id = 123  AND File_Id IN (1,2,3) AND Business_Date IN (DATE '{today}', DATE '{today}');")
+            for target, teradata_path, multi_svn_id in targets:
 
-        add_lines = True
+                observer.schedule(ChangeHandler(target), str(teradata_path), recursive=True)
 
-       
+            observer.start()
 
-        #file = open(redeploy_init, "r")
+            interval, method = 0.5, 'filesystem notifications'
 
-        #for line in file:
+        else:
 
-        #    if delete[0] == line.strip():
+            snapshots = {target: snapshot(teradata_path) for target, teradata_path, multi_svn_id in targets}
 
-        #        add_lines = False
+            interval, method = self.args.watch_interval, f'polling every {self.args.watch_interval}s'
 
-        #        break
+        print(f'\nWatching           : {len(targets)} TERADATA folder(s), {method} (Ctrl+C to stop)')
 
-        with open(redeploy_init, "a+") as file:
+        try:
 
-            for line in file:
+            while True:
+
+                time.sleep(interval)
+
+                for target, teradata_path, multi_svn_id in targets:
+
+                    if observer is None:
+
+                        current = snapshot(teradata_path)
+
+                        if current != snapshots[target]: snapshots[target], changed_at[target] = current, time.time()
 
-                if delete[0] == line.strip():
+                    if target in changed_at and time.time() - changed_at[target] >= self.args.watch_debounce:
 
-                    add_lines = False
+                        changed_at.pop(target, None)
 
-                    file.write(f"--should exist\n\n--should not exist\n\n--?\n\n")
+                        self.refresh_release(target, multi_svn_id)
 
-                    break
+        except KeyboardInterrupt:
 
-       
+            print('\nWatch stopped')
 
-        if add_lines:
+        finally:
 
-            with open(redeploy_init, 'a+') as file:
+            if observer is not None:
 
-                for line in delete:
+                observer.stop()
 
-                    file.write('\n'+line)
+                observer.join()
 
  
 
@@ -1324,15 +4684,9 @@ class DWHTestInit:
 
             deploy_items_path = None
 
-            for f in self.file_list:
-
-                print(f' ==> str(f) = {str(f)}')
-
-                if str(f).lower().endswith('deploy_items.txt'):
-
-                    deploy_items_path = f
+            found = self.files.named('deploy_items.txt')
 
-                    break
+            if found: deploy_items_path = found[0].path
 
             if deploy_items_path: print(f'deploy_items.txt found   : {deploy_items_path}')
 
@@ -1354,23 +4708,15 @@ class DWHTestInit:
 
             synopsis_list = []
 
-            for line in self.file_list:
-
-                p = pathlib.PurePath(str(line).replace(str(self.teradata_parent_path), ''))
-
-                if len(p.parts) > 1:
-
-                    if p.parts[1].upper() == 'TERADATA':
+            for entry in self.files.with_suffix('.sql', '.ddl'):
 
-                    #if p.parts[1].upper() == str(self.teradata_path).split('\\')[-1].upper():
+                if entry.teradata:
 
-                        if str(line).lower().endswith('.sql') or str(line).lower().endswith('.ddl'):
+                    line_count += 1
 
-                            line_count += 1
+                    lines.append("{0:0=3d}".format(line_count) + "|.." + entry.rel)
 
-                            lines.append("{0:0=3d}".format(line_count) + "|.." + str(line).replace(str(self.teradata_parent_path), ''))
-
-                            synopsis_list.append(line)
+                    synopsis_list.append(entry.path)
 
            
 
@@ -1452,10 +4798,16 @@ class DWHTestInit:
 
             shutil.copy(deploy_items_path, self.teradata_parent_path)
 
+            self.files.add(self.teradata_parent_path / deploy_items_path.name)
+
             #rename deploy_items.txt to deploy_items.original
 
             deploy_items_path.rename(deploy_items_path.with_suffix('.original'))
 
+            self.files.remove(deploy_items_path)
+
+            self.files.add(deploy_items_path.with_suffix('.original'))
+
             deploy_items_path = get_deploy_items_path()
 
             deploy_items_parent_path = pathlib.Path(deploy_items_path).resolve().parents[0]
@@ -1506,7 +4858,7 @@ class DWHTestInit:
 
         for d in dir_list:
 
-            if str(d).lower().endswith('teradata') and 'rollback' not in str(d).lower() and not str(d).lower().endswith('ods_vteradata'):
+            if is_teradata_folder(d):
 
                 teradata_path = d
 
@@ -1536,11 +4888,73 @@ class DWHTestInit:
 
         pathlib.Path(checkout_target_dir).mkdir(parents=True, exist_ok=True) # make target directory
 
-        os.chdir(str(checkout_target_dir).replace(self.g_drive, 'G:').lstrip('\\'))
+        target_dir = str(checkout_target_dir).replace(self.g_drive, 'G:').lstrip('\\')
 
         if 'â€“' in svn_url: svn_url = svn_url.replace('â€“', '–')
 
-        return os.system(f'svn checkout "{svn_url}"')
+        if self.args.sparse: return self.sparse_checkout(svn_url, target_dir)
+
+        return svn(f'checkout "{svn_url}"', target_dir)
+
+ 
+
+    def sparse_checkout(self, svn_url, target_dir):
+
+        '''--sparse: list the release in SVN and checkout only its TERADATA folder, the files (not the subfolders) of the folders
+
+        above it and the --expand folders; the whole release is checked out if it has no TERADATA folder
+
+        runs svn in target_dir, like checkout()'''
+
+        release_folder = svn_url.rstrip('/').split('/')[-1]
+
+        listing = subprocess.run(f'svn list -R "{svn_url}"', shell=True, cwd=target_dir, capture_output=True, text=True)
+
+        remote_dirs = sorted(line.rstrip('/') for line in listing.stdout.splitlines() if line.endswith('/'))
+
+        if listing.returncode != 0:
+
+            print('WARNING: svn list failed, checking out the whole release')
+
+            return svn(f'checkout "{svn_url}"', target_dir)
+
+        teradata_dirs = [d for d in remote_dirs if is_teradata_folder(d)]
+
+        if not teradata_dirs:
+
+            print('Sparse checkout    : no TERADATA folder in the release, checking out the whole release')
+
+            return svn(f'checkout "{svn_url}"', target_dir)
+
+        print(f'Sparse checkout    : {teradata_dirs[0]} ({len(remote_dirs)} folders in the release)')
+
+        status = svn(f'checkout --depth files "{svn_url}"', target_dir)
+
+        for folder in [teradata_dirs[0]] + (self.args.expand.split(',') if self.args.expand else []):
+
+            if status == 0: status = self.expand_checkout(release_folder, folder.replace('\\', '/').strip('/'), target_dir)
+
+        return status
+
+ 
+
+    def expand_checkout(self, release_folder, folder, target_dir):
+
+        '''fetch a folder of a sparse checkout with everything in it, and the files (not the subfolders) of the folders above it
+
+        folder is relative to the release folder, e.g. "Rollback" or "DB/TERADATA"; release_folder is in target_dir'''
+
+        parts = folder.split('/')
+
+        for n in range(1, len(parts)):
+
+            parent = '/'.join(parts[:n])
+
+            status = svn(f'update --set-depth files "{release_folder}/{parent}"', target_dir)
+
+            if status != 0: return status
+
+        return svn(f'update --set-depth infinity "{release_folder}/{folder}"', target_dir)
 
  
 
@@ -1548,11 +4962,19 @@ class DWHTestInit:
 
         '''read an .ini file and return results in a dictionary called ini'''
 
-        config = configparser.ConfigParser(interpolation=None)
+        config_key = (str(pathlib.Path(config_file_name).resolve()), os.path.getmtime(config_file_name) if os.path.isfile(config_file_name) else None)
+
+        config = None if self.resident is None else self.resident.configs.get(config_key)
+
+        if config is None:
+
+            config = configparser.ConfigParser(interpolation=None)
 
-        try: config.read(config_file_name)
+            try: config.read(config_file_name)
 
-        except: raise NameError(f'{config_file_name} contains duplicate section names.')
+            except: raise NameError(f'{config_file_name} contains duplicate section names.')
+
+            if self.resident is not None: self.resident.configs[config_key] = config
 
         if config_name not in config:
 
@@ -1636,7 +5058,7 @@ class DWHTestInit:
 
                         if ini_key_opt in ini: print(f"{ini_key_opt}{' '*(max_ini_key_len-len(ini_key_opt)+1)}: {ini[ini_key_opt]}")
 
-                       else: break
+                        else: break
 
            
 
@@ -1672,7 +5094,7 @@ class DWHTestInit:
 
  
 
-    def get_args(self):
+    def get_args(self, argv=None):
 
         '''return args'''
 
@@ -1680,19 +5102,379 @@ class DWHTestInit:
 
         parser.add_argument("--i", help=".ini filename")
 
-        parser.add_argument("config", help="configuration in .ini file to use")
+        parser.add_argument("config", help="configuration in .ini file to use", nargs='?')
 
         parser.add_argument("-z", help="Run post-load testing only", action='store_true')
 
-        args = parser.parse_args()
+        parser.add_argument("--cache_ttl", help="hours that cached catalog metadata stays valid (default 24)", type=float, default=24)
+
+        parser.add_argument("--cache_size", help="maximum number of cached catalog lookups (default 10000)", type=int, default=10000)
+
+        parser.add_argument("--refresh_cache", help="discard cached catalog metadata and query the catalog again", action='store_true')
+
+        parser.add_argument("--row_count_mode", help="-z row counts: exact COUNT(*), or estimate from collected statistics (default exact)", choices=['exact', 'estimate'], default='exact')
+
+        parser.add_argument("--stats_max_age", help="days after which statistics are too stale for estimated row counts (default 7)", type=int, default=7)
+
+        parser.add_argument("--key_discovery", help="-z data checks: find common key values with TOP ... ORDER BY, or by random sampling (default top)", choices=['top', 'sample'], default='top')
+
+        parser.add_argument("--num_values_to_check", help="-z data checks: key values read per database, or the initial sample size (default 50000)", type=int, default=50000)
+
+        parser.add_argument("--max_values_to_find", help="-z data checks: common key values to check per table (default 20)", type=int, default=20)
+
+        parser.add_argument("--sample_budget", help="-z data checks: maximum rows sampled and looked up per table (default 1000000)", type=int, default=1000000)
+
+        parser.add_argument("--parquet", help="-z: also export query results as parquet files (needs pyarrow)", action='store_true')
+
+        parser.add_argument("--stage", help="work in a local staging folder (default: %%TEMP%%\\DWHTestInit\\<config>) and copy the results to work_folder; every run first copies the files of work_folder that are new or changed there (all of them on the first run), apart from the release checkouts, which are checked out in the staging folder and of which only changed files are copied back", nargs='?', const='', default=None)
+
+        parser.add_argument("--stage_sync", help="--stage: copy results at the end of the run, or in the background after each phase (default end)", choices=['end', 'phase'], default='end')
+
+        parser.add_argument("--parse_workers", help="parse release files in this many processes (default 1: no process pool)", type=int, default=1)
+
+        parser.add_argument("--parse_min_files", help="--parse_workers: parse fewer files than this without the process pool (default 200)", type=int, default=200)
+
+        parser.add_argument("--resume", help="-z: skip objects finished by the last run and continue its evidence files; everything from the first failed object on is run again", action='store_true')
+
+        parser.add_argument("--watch", help="after the run, regenerate deploy_items.txt, the synopsis and the checks whenever files in the TERADATA folder change", action='store_true')
+
+        parser.add_argument("--watch_interval", help="--watch: seconds between polls when watchdog is not installed (default 2)", type=float, default=2)
+
+        parser.add_argument("--watch_debounce", help="--watch: seconds without further changes before refreshing (default 3)", type=float, default=3)
+
+        parser.add_argument("--environments", help="-z: run the row counts and data checks in each of these environments at the same time and compare them, e.g. T05,D01=DSN_DR,P00=DSN_PRD (default DSN DWHDR)")
+
+        parser.add_argument("--recount_all", help="-z row counts: also count the tables outside the deploy set that have not changed since they were last counted", action='store_true')
+
+        parser.add_argument("--bundle_size", help="-z: send row count and fingerprint queries in requests of up to this many characters (default 60000, 0: one request per query)", type=int, default=60000)
+
+        parser.add_argument("--cost_budget", help="-z: EXPLAIN the queries first; objects/queries estimated to take longer than this many seconds, or not estimated, are over the budget (default 0: no EXPLAIN)", type=float, default=0)
+
+        parser.add_argument("--spool_budget", help="-z: as --cost_budget, for queries with a step estimated to produce more rows than this (default 0: no limit)", type=int, default=0)
+
+        parser.add_argument("--over_budget", help="-z: skip objects over the budget, use statistics / sampled key values for them, or run them after the others (default defer)", choices=['skip', 'sample', 'defer'], default='defer')
+
+        parser.add_argument("--stream_evidence", help="-z: write result sets to the evidence files row by row, without formatting them into one string first", action='store_true')
+
+        parser.add_argument("--stream_sample", help="--stream_evidence: rows read to fit the column widths (default 1000)", type=int, default=1000)
+
+        parser.add_argument("--sparse", help="only checkout the TERADATA folder of the release (and the files of the folders above it), found with svn list", action='store_true')
+
+        parser.add_argument("--expand", help="--sparse: also checkout these folders of the release, e.g. Rollback,Docs/Design (an existing sparse checkout is expanded)")
+
+        parser.add_argument("--task_workers", help="run independent steps (template copy, synopsis, database checks, ...) on this many threads (default 4, 1: one by one)", type=int, default=4)
+
+        parser.add_argument("--show_graph", help="print the steps of the run with the resources they read and write and the steps they wait for, and how long each step took", action='store_true')
+
+        parser.add_argument("--which", help="print the indexed releases and files that define a table/view, e.g. DWT05V_ODS.ACCOUNT or DW$$ENV$$V_ODS.ACC%% (no config needed)")
+
+        parser.add_argument("--full", help="ignore the manifest of the last run and redo every phase", action='store_true')
+
+        parser.add_argument("--deploy_parallel", help="maximum concurrent deploys per wave in the _deploy_waves.cmd file (default 4)", type=int, default=4)
+
+        parser.add_argument("--skip_trivial_views", help="-z: do not count/check views that are a plain SELECT * over a table in the release", action='store_true')
+
+        parser.add_argument("--pipeline", help="-z: count rows and check data concurrently", action='store_true')
+
+        parser.add_argument("--workers", help="--pipeline: number of database sessions (default 4)", type=int, default=4)
+
+        parser.add_argument("--queue_size", help="--pipeline: maximum row counts/data checks queued for the sessions, and databases/objects per estimate and cost gate batch (default 100)", type=int, default=100)
+
+        parser.add_argument("--data_check_mode", help="-z data checks: compare key rows, or compare table fingerprints and only check rows of tables that differ (default rows)", choices=['rows', 'fingerprint'], default='rows')
+
+        parser.add_argument("--daemon", help="run as a daemon on localhost that keeps sessions and caches and runs jobs sent with --use_daemon (other arguments are ignored)", action='store_true')
+
+        parser.add_argument("--use_daemon", help="run this command in the daemon started with --daemon", action='store_true')
+
+        parser.add_argument("--daemon_port", help="--daemon/--use_daemon: localhost port (default 6543)", type=int, default=6543)
+
+        args = parser.parse_args(argv)
+
+        if args.config is None and args.which is None: parser.error('the following arguments are required: config')
+
+        return args.i, args.config, args.z, args
+
+ 
+
+class ThreadOutput(io.TextIOBase):
+
+    '''stand-in for sys.stdout that keeps what a thread prints after capture() in a buffer of its own, for another thread to print
+
+    threads that have not called capture() print to stream'''
+
+    def __init__(self, stream):
+
+        self.stream, self.buffers = stream, {}
+
+ 
+
+    def capture(self):
+
+        '''keep what this thread prints from now on in a new buffer and return it'''
+
+        buffer = self.buffers[threading.get_ident()] = io.StringIO()
+
+        return buffer
+
+ 
+
+    def release(self):
+
+        '''print to stream again from this thread'''
+
+        self.buffers.pop(threading.get_ident(), None)
+
+ 
+
+    def write(self, text):
+
+        return self.buffers.get(threading.get_ident(), self.stream).write(text)
+
+ 
+
+    def flush(self):
+
+        self.stream.flush()
+
+ 
+
+class ConnectionWriter(io.TextIOBase):
+
+    '''file-like object that sends what is written to a --use_daemon client'''
+
+    def __init__(self, conn):
+
+        self.conn = conn
+
+ 
+
+    def write(self, text):
+
+        if self.conn is not None and text:
+
+            try: self.conn.send(('output', text))
+
+            except OSError: self.conn = None #client gone, the job carries on
+
+        return len(text)
+
+ 
+
+class ResidentSession:
+
+    '''database session kept by the daemon between jobs: when a query raises (the network dropped, a DBA killed the session, ...)
+
+    it logs on again and retries the query once, instead of every later job failing until the daemon is restarted'''
+
+    def __init__(self, dsn):
+
+        self.dsn, self.session = dsn, teradata_funcs.teradata_funcs(dsn)
+
+ 
+
+    def Teradata_query(self, query):
+
+        try: return self.session.Teradata_query(query)
+
+        except Exception as e:
+
+            print(f'WARNING: query failed ({e}), logging on to {self.dsn} again and retrying')
+
+            self.session = teradata_funcs.teradata_funcs(self.dsn)
+
+            return self.session.Teradata_query(query)
+
+ 
+
+    def __getattr__(self, name):
+
+        return getattr(self.session, name)
+
+ 
+
+class Daemon:
+
+    '''--daemon: run DWHTestInit jobs sent by --use_daemon clients on localhost, one at a time
+
+    database sessions, parsed .ini files, release manifests (with their parsed files) and the metadata cache
+
+    stay in memory between jobs; jobs are not interactive (questions get their default answer)'''
+
+    def __init__(self, port):
+
+        self.port = port
+
+        self.key_file = pathlib.Path.home() / '.DWHTestInit' / 'daemon.key' #only readable by clients of this user, see write_key()
+
+        self.sessions, self.metadata_cache, self.configs, self.manifests = [], None, {}, {}
+
+        self.templates_checked = False
+
+ 
+
+    def serve(self):
+
+        self.key_file.parent.mkdir(parents=True, exist_ok=True)
+
+        authkey = os.urandom(32)
+
+        self.write_key(authkey)
+
+        try:
+
+            with multiprocessing.connection.Listener(('localhost', self.port), authkey=authkey) as listener:
+
+                print(f'Daemon             : listening on localhost:{self.port} (Ctrl+C to stop)')
+
+                while True:
+
+                    try: conn = listener.accept()
+
+                    except (OSError, multiprocessing.AuthenticationError) as e:
+
+                        print(f'WARNING: connection refused: {e}')
+
+                        continue
+
+                    with conn: self.run_job(conn)
+
+        except KeyboardInterrupt:
+
+            print('\nDaemon stopped')
+
+        finally:
+
+            self.key_file.unlink(missing_ok=True)
+
+ 
+
+    def write_key(self, authkey):
+
+        '''write the key clients authenticate with to a new key file only this user can read:
+
+        mode 0600, and on Windows an ACL that grants this user alone access (the file does not inherit the folder's ACL)'''
+
+        self.key_file.unlink(missing_ok=True) #os.open() does not change the mode of an existing file
+
+        fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o600)
+
+        if os.name == 'nt':
+
+            acl = subprocess.run(['icacls', str(self.key_file), '/inheritance:r', '/grant:r', f"{os.environ['USERNAME']}:F"], capture_output=True, text=True)
+
+            if acl.returncode != 0:
+
+                os.close(fd)
+
+                self.key_file.unlink(missing_ok=True)
+
+                print(f'Unable to restrict access to {self.key_file}: {acl.stdout}{acl.stderr}');exit()
+
+        with os.fdopen(fd, 'wb') as f:
+
+            f.write(authkey)
+
+ 
+
+    def run_job(self, conn):
+
+        '''run one job: receive (argv, working directory), send ('output', text) messages and a final ('exit', status)'''
+
+        try: argv, cwd = conn.recv()
+
+        except (EOFError, OSError): return
+
+        if '--watch' in argv:
+
+            conn.send(('output', '--watch runs until Ctrl+C and cannot run in the daemon\n'))
+
+            conn.send(('exit', 1))
+
+            return
+
+        start, status = time.time(), 0
+
+        print(f"{datetime.datetime.now():%H:%M:%S} job: {' '.join(argv)}", end='', flush=True)
+
+        os.chdir(cwd)
+
+        writer = ConnectionWriter(conn)
+
+        with contextlib.redirect_stdout(writer):
+
+            try: DWHTestInit(argv, self)
+
+            except SystemExit as e: status = e.code if isinstance(e.code, int) else 1
+
+            except Exception:
 
-        return args.i, args.config, args.z
+                print(traceback.format_exc())
+
+                status = 1
+
+        print(f' --> exit {status} in {time.time()-start:.1f}s')
+
+        if writer.conn is not None:
+
+            try: conn.send(('exit', status))
+
+            except OSError: pass
+
+ 
+
+def daemon_client(argv, port):
+
+    '''--use_daemon: run argv in the daemon, print its output and return its exit status'''
+
+    argv = [arg for arg in argv if arg != '--use_daemon']
+
+    key_file = pathlib.Path.home() / '.DWHTestInit' / 'daemon.key'
+
+    try: conn = multiprocessing.connection.Client(('localhost', port), authkey=key_file.read_bytes())
+
+    except (OSError, multiprocessing.AuthenticationError) as e:
+
+        print(f'No daemon on localhost:{port} ({e}), start one with --daemon')
+
+        return 1
+
+    with conn:
+
+        conn.send((argv, os.getcwd()))
+
+        while True:
+
+            try: kind, value = conn.recv()
+
+            except EOFError:
+
+                print('\nERROR: the daemon closed the connection')
+
+                return 1
+
+            if kind == 'exit': return value
+
+            print(value, end='', flush=True)
 
  
 
 def main():
 
-    x = DWHTestInit()
+    parser = argparse.ArgumentParser(add_help=False) #the full argument list is in DWHTestInit.get_args()
+
+    parser.add_argument("--daemon", action='store_true')
+
+    parser.add_argument("--use_daemon", action='store_true')
+
+    parser.add_argument("--daemon_port", type=int, default=6543)
+
+    args, other_args = parser.parse_known_args()
+
+    if args.daemon: Daemon(args.daemon_port).serve()
+
+    elif args.use_daemon: sys.exit(daemon_client(sys.argv[1:], args.daemon_port))
+
+    else: x = DWHTestInit()
 
  
 
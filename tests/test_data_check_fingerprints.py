@@ -0,0 +1,58 @@
+"""
+test_data_check_fingerprints.py
+ 
+Usage:   python -m pytest tests
+Purpose: --data_check_mode fingerprint, run against a fake session that hashes the HASHROW expressions of the
+         fingerprint queries the way Teradata evaluates them (a cast to VARCHAR(n) keeps the first n characters)
+"""
+ 
+import pathlib
+import re
+import sys
+import types
+ 
+sys.modules.setdefault('DWHTestDocGenerator', types.ModuleType('DWHTestDocGenerator')) #only needed for -i
+sys.modules.setdefault('teradata_funcs', types.ModuleType('teradata_funcs')) #the session is faked
+source = pathlib.Path(__file__).parents[1] / 'test.py' #indented with non-breaking spaces, which Python does not accept
+DWHTestInit = sys.modules['DWHTestInit'] = types.ModuleType('DWHTestInit')
+DWHTestInit.__file__ = str(source)
+exec(compile(source.read_text(encoding='utf-8').replace('\xa0', ' '), str(source), 'exec'), DWHTestInit.__dict__)
+ 
+class FakeSession:
+    '''answers the fingerprint queries of table T in databases DB1 and DB2 from rows {database: [{column: value}, ...]}
+    key discovery finds no common key values, so a table whose fingerprints differ reports "has no data"'''
+    def __init__(self, rows):
+        self.rows, self.queries = rows, []
+ 
+    def value(self, row, expression):
+        cast = re.fullmatch(r'Cast\("(\w+)" AS VARCHAR\((\d+)\)\)', expression)
+        if cast: return str(row[cast.group(1)])[:int(cast.group(2))]
+        return row[expression.strip('"')]
+ 
+    def Teradata_query(self, query):
+        self.queries.append(query)
+        if 'GCFR_Transform_KeyCol' in query: return [('K',)]
+        if 'dbc.COLUMNS' in query: return [('K',), ('V',)]
+        if 'HASHROW(' in query:
+            db = query.split(' FROM ')[1].split('.')[0]
+            expressions = re.search(r"HASHROW\((.*?)\), 'base10'", query).group(1).split(', ')
+            return [(f'{db}.T', len(self.rows[db]), sum(hash(tuple(self.value(row, expression) for expression in expressions)) for row in self.rows[db]))]
+        return []
+ 
+def data_check(session):
+    o = DWHTestInit.DWHTestInit.__new__(DWHTestInit.DWHTestInit)
+    o.args = o.get_args(['DWH-1', '--data_check_mode', 'fingerprint', '--bundle_size', '0'])[3]
+    o.ini, o.session, o.explained = {'environment': 'T05'}, session, {}
+    o.metadata_cache = DWHTestInit.MetadataCache(pathlib.Path(__file__).with_name('unused.json'), 1, 10, refresh=True)
+    return o.data_check_evidence('T', ['DB1', 'DB2'], session)
+ 
+def test_equal_tables_match():
+    rows = [{'K': 1, 'V': 'x' * 60}, {'K': 2, 'V': 'y'}]
+    evidence, status = data_check(FakeSession({'DB1': rows, 'DB2': list(reversed(rows))}))
+    assert status == 'fingerprints match'
+ 
+def test_tables_that_differ_past_character_50_differ():
+    session = FakeSession({'DB1': [{'K': 1, 'V': 'x' * 50 + 'a'}], 'DB2': [{'K': 1, 'V': 'x' * 50 + 'b'}]})
+    evidence, status = data_check(session)
+    assert status != 'fingerprints match'
+    assert '--fingerprints differ, row-level checks follow\n' in evidence
@@ -0,0 +1,76 @@
+"""
+test_data_check_keys.py
+
+Usage:   python -m pytest tests
+Purpose: data checks with key columns that are not character columns (INTEGER, DECIMAL, DATE, TIMESTAMP)
+         or NOT CASESPECIFIC, run against a fake session that returns the keys in their own type
+"""
+ 
+import datetime
+import decimal
+import pathlib
+import sys
+import types
+ 
+sys.modules.setdefault('DWHTestDocGenerator', types.ModuleType('DWHTestDocGenerator')) #only needed for -i
+sys.modules.setdefault('teradata_funcs', types.ModuleType('teradata_funcs')) #the session is faked
+source = pathlib.Path(__file__).parents[1] / 'test.py' #indented with non-breaking spaces, which Python does not accept
+DWHTestInit = sys.modules['DWHTestInit'] = types.ModuleType('DWHTestInit')
+DWHTestInit.__file__ = str(source)
+exec(compile(source.read_text(encoding='utf-8').replace('\xa0', ' '), str(source), 'exec'), DWHTestInit.__dict__)
+ 
+class FakeSession:
+    '''answers the data check queries of table T in databases DB1 and DB2 from rows {database: [(key, value), ...]}
+    keys are returned as Teradata returns them; in_list_key(literal) turns an IN list literal back into a key'''
+    def __init__(self, rows, in_list_key, casespecific=True):
+        self.rows, self.in_list_key, self.casespecific, self.queries = rows, in_list_key, casespecific, []
+ 
+    def same(self, key, literal_key):
+        if isinstance(key, str) and not self.casespecific: return key.rstrip().upper() == literal_key.upper()
+        return key.rstrip() == literal_key if isinstance(key, str) else key == literal_key
+ 
+    def Teradata_query(self, query):
+        self.queries.append(query)
+        if 'GCFR_Transform_KeyCol' in query: return [('K',)]
+        if 'dbc.COLUMNS' in query: return [('K',), ('V',)]
+        if query.startswith('SEL TOP'):
+            db = query.split(' FROM ')[1].split('.')[0]
+            return sorted([(key,) for key, value in self.rows[db]], key=lambda row: str(row[0]))
+        results = []
+        for n, select in enumerate(query.rstrip(';').replace(' ORDER BY 1, 2', '').split(' UNION ALL '), 1):
+            db = select.split(' FROM ')[1].split('.')[0]
+            literals = select.split(' IN (')[1].rsplit(')', 1)[0].split(', ')
+            keys = [self.in_list_key(literal) for literal in literals]
+            results += [(key, n, f'{db}.T', str(key), value) for key, value in self.rows[db] if any(self.same(key, literal_key) for literal_key in keys)]
+        return results
+ 
+def data_check(session):
+    o = DWHTestInit.DWHTestInit.__new__(DWHTestInit.DWHTestInit)
+    o.args = o.get_args(['DWH-1', '--max_values_to_find', '2'])[3]
+    o.ini, o.session, o.explained = {'environment': 'T05'}, session, {}
+    o.metadata_cache = DWHTestInit.MetadataCache(pathlib.Path(__file__).with_name('unused.json'), 1, 10, refresh=True)
+    return o.data_check_evidence('T', ['DB1', 'DB2'], session)
+ 
+def result_sets(evidence):
+    return {item[0]: sorted(row[-1] for row in item[2]) for item in evidence if not isinstance(item, str)}
+ 
+def test_integer_keys():
+    session = FakeSession({'DB1': [(1, 'a'), (2, 'b')], 'DB2': [(1, 'a2'), (2, 'b2')]}, int)
+    evidence, status = data_check(session)
+    assert 'K IN (1, 2)' in session.queries[-1] and 'SELECT K, 1,' in session.queries[-1]
+    assert result_sets(evidence) == {'T_1': ['a', 'a2'], 'T_2': ['b', 'b2']}
+ 
+def test_decimal_date_and_timestamp_keys():
+    for keys, literal_key in [((decimal.Decimal('1.50'), decimal.Decimal('2.00')), lambda literal: decimal.Decimal(literal)),
+                              ((datetime.date(2026, 1, 31), datetime.date(2026, 2, 1)), lambda literal: datetime.date.fromisoformat(literal.split("'")[1])),
+                              ((datetime.datetime(2026, 1, 31, 23, 59, 59, 500000), datetime.datetime(2026, 2, 1)), lambda literal: datetime.datetime.fromisoformat(literal.split("'")[1]))]:
+        session = FakeSession({'DB1': [(keys[0], 'a'), (keys[1], 'b')], 'DB2': [(keys[0], 'a2'), (keys[1], 'b2')]}, literal_key)
+        evidence, status = data_check(session)
+        assert status is None
+        assert result_sets(evidence) == {f'T_{keys[0]}': ['a', 'a2'], f'T_{keys[1]}': ['b', 'b2']}
+ 
+def test_not_casespecific_char_keys():
+    session = FakeSession({'DB1': [('ab  ', 'a'), ('CD  ', 'c')], 'DB2': [('AB', 'a2'), ('cd', 'c2')]}, lambda literal: literal.strip("'"), casespecific=False)
+    evidence, status = data_check(session)
+    assert "K IN ('CD', 'ab')" in session.queries[-1]
+    assert result_sets(evidence) == {'T_ab': ['a', 'a2'], 'T_CD': ['c', 'c2']}